@@ -22,3 +22,19 @@ do
     ./scripts/pnr_flow.sh $cgra $file.json
 done
 
+# mock designs that used to fail to route. the hardware is generated, the
+# packed and placed netlists are kept since placement is not deterministic
+python mock/generate_hardware.py -s 16 --num_track 5 --num_io 8 \
+    -o mock_s16_t5.xml
+python mock/generate_hardware.py -s 32 --num_track 5 --num_io 20 \
+    -o mock_s32_t5.xml
+for design in mock_s16_t5_0 mock_s32_t5_1
+do
+    for mode in "" "--negotiate"
+    do
+        python router.py -c ${design%_*}.xml \
+            -i mock/regression/${design}.packed \
+            -p mock/regression/${design}.place \
+            -o ${design}.route --no-vis $mode
+    done
+done
@@ -5,8 +5,8 @@ import os
 from arch import find_latency_path, compute_routing_usage
 from arch import parse_routing_result, find_critical_path_delay
 from arch import compute_latency, compute_total_wire
-from arch import parse_placement, parse_cgra, compute_area_usage
-from arch.cgra_route import parse_routing_resource, build_routing_resource
+from arch import parse_placement, load_cgra, compute_area_usage
+from arch import load_routing_resource
 
 
 def main():
@@ -18,9 +18,10 @@ def main():
     cgra_file = sys.argv[1]
     netlist = sys.argv[2]
     route_file = sys.argv[3]
-    packed_file = route_file.replace(".route", ".packed")
-    placement_file = route_file.replace(".route", ".place")
-    board_meta = parse_cgra(cgra_file)["CGRA"]
+    design_name = os.path.splitext(route_file)[0]
+    packed_file = design_name + ".packed"
+    placement_file = design_name + ".place"
+    board_meta = load_cgra(cgra_file)["CGRA"]
     routing_result = parse_routing_result(route_file)
     placement, _ = parse_placement(placement_file)
 
@@ -83,8 +84,7 @@ def main():
                                                percentage))
 
     print("-" * cols)
-    r = parse_routing_resource(cgra_file)
-    routing_resource = build_routing_resource(r)
+    routing_resource = load_routing_resource(cgra_file)
     resource_usage = compute_routing_usage(routing_result, routing_resource,
                                            board_meta[0])
     for bus in resource_usage:
@@ -6,7 +6,9 @@ from .cgra_packer import read_netlist_json
 from .cgra_analytics import find_latency_path, compute_routing_usage
 from .cgra_analytics import compute_latency, find_critical_path_delay
 from .cgra_analytics import compute_total_wire, compute_area_usage
-from .cgra import parse_routing_result
+from .cgra import parse_routing_result, load_routing_result
+from .route_file import RoutingResultFile, save_binary_routing_result
 from .cgra import parse_placement, save_placement
 from .bookshelf import mock_board_meta
 from .netlist import kernel_partition
+from .cache import load_cgra, load_routing_resource
@@ -0,0 +1,85 @@
+from __future__ import print_function
+from six.moves import cPickle as pickle
+from .arch import parse_cgra
+from .cgra_route import parse_routing_resource, build_routing_resource
+import hashlib
+import os
+import sys
+
+
+# bump it whenever the cached results change in a way that the source files
+# below can't tell
+CACHE_VERSION = 1
+# source files whose content is part of the cache key
+CODE_FILES = ["arch.py", "cgra_route.py", "cache.py"]
+CACHE_DIR = os.environ.get("CGRA_PNR_CACHE_DIR",
+                           os.path.join(os.path.expanduser("~"), ".cache",
+                                        "cgra_pnr"))
+
+code_stamp = None
+
+
+def get_code_stamp():
+    """hash of the parsing code and CACHE_VERSION"""
+    global code_stamp
+    if code_stamp is None:
+        h = hashlib.sha1()
+        h.update(str(CACHE_VERSION).encode())
+        h.update(str(sys.version_info[:2]).encode())
+        code_dir = os.path.dirname(os.path.abspath(__file__))
+        for code_file in CODE_FILES:
+            with open(os.path.join(code_dir, code_file), "rb") as f:
+                h.update(f.read())
+        code_stamp = h.hexdigest()
+    return code_stamp
+
+
+def get_cache_filename(filename, key):
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        h.update(f.read())
+    h.update(get_code_stamp().encode())
+    h.update(repr(key).encode())
+    return os.path.join(CACHE_DIR, h.hexdigest() + ".pkl")
+
+
+def load_cached(filename, key, build_fn):
+    """returns build_fn(), which is cached on disk based on the content of
+       filename, key and the code version. set CGRA_PNR_NO_CACHE to disable
+       the cache"""
+    if os.environ.get("CGRA_PNR_NO_CACHE"):
+        return build_fn()
+    cache_filename = get_cache_filename(filename, key)
+    if os.path.isfile(cache_filename):
+        try:
+            with open(cache_filename, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            # corrupted cache, rebuild it
+            print("Failed to load cache", cache_filename, file=sys.stderr)
+    result = build_fn()
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        # write to a temp file first so that other processes won't read a
+        # partial one
+        tmp_filename = cache_filename + "." + str(os.getpid())
+        with open(tmp_filename, "wb") as f:
+            pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_filename, cache_filename)
+    except (IOError, OSError):
+        print("Failed to write cache", cache_filename, file=sys.stderr)
+    return result
+
+
+def load_cgra(filename, use_tile_addr=False, fold_reg=True):
+    """cached parse_cgra"""
+    return load_cached(filename, ("parse_cgra", use_tile_addr, fold_reg),
+                       lambda: parse_cgra(filename, use_tile_addr, fold_reg))
+
+
+def load_routing_resource(filename):
+    """cached routing resource built from the CGRA file"""
+    return load_cached(filename, ("routing_resource",),
+                       lambda: build_routing_resource(
+                           parse_routing_resource(filename)))
@@ -5,6 +5,7 @@ import json
 import six
 
 from . import load_packed_file, read_netlist_json
+from .route_file import is_binary_routing_file, RoutingResultFile
 
 
 def save_placement(board_pos, id_to_name, _, place_file):
@@ -161,6 +162,9 @@ def save_routing_result(route_result, output_file):
 
 
 def parse_routing_result(routing_file):
+    if is_binary_routing_file(routing_file):
+        with RoutingResultFile(routing_file) as route_file:
+            return dict(route_file.items())
     with open(routing_file) as f:
         lines = f.readlines()
     result = {}
@@ -272,6 +276,38 @@ def parse_routing_result(routing_file):
     return result
 
 
+def load_routing_result(routing_file):
+    """parse the routing result into the path format used by the router,
+       which can be saved by save_routing_result"""
+    if is_binary_routing_file(routing_file):
+        with RoutingResultFile(routing_file) as route_file:
+            return dict(route_file.iter_paths())
+    parsed_result = parse_routing_result(routing_file)
+    route_result = {}
+    for net_id in parsed_result:
+        path = []
+        for entry in parsed_result[net_id]:
+            if entry[0] == "src":
+                _, (pos, port), (dir_out, dir_in) = entry
+                path.append([(pos, port, dir_out, dir_in)])
+            elif entry[0] == "link":
+                _, (p1, p2), (dir_out, dir_in) = entry
+                path.append(((p1, dir_out), (p2, dir_in)))
+            elif len(entry) == 4:
+                # self-connection sink
+                _, (_, (dir_in, conn)), _, (pos, port) = entry
+                path.append([dir_in, conn, pos, port])
+            elif isinstance(entry[1][0], tuple):
+                # reg sink re-written by the reg net
+                _, (dir_out, conn), (pos, _) = entry
+                path.append((conn, pos, dir_out))
+            else:
+                _, conn, (pos, port) = entry
+                path.append((conn, pos, port))
+        route_result[net_id] = path
+    return route_result
+
+
 def generate_bitstream(board_filename, netlist_filename,
                        packed_filename, placement_filename,
                        routing_filename, output_filename,
@@ -280,7 +316,7 @@ def generate_bitstream(board_filename, netlist_filename,
     netlists, folded_blocks, id_to_name, changed_pe =\
         load_packed_file(packed_filename)
     g = build_graph(netlists)
-    board_meta = arch.parse_cgra(board_filename, True)["CGRA"]
+    board_meta = arch.load_cgra(board_filename, True)["CGRA"]
     placement, _ = parse_placement(placement_filename)
     route_result = parse_routing_result(routing_filename)
     tile_mapping = board_meta[-1]
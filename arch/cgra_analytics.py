@@ -1,7 +1,10 @@
+from __future__ import division
 from .graph import get_raw_connections
 from .graph import build_raw_graph
 from .cgra import load_packed_file, read_netlist_json
 from .cgra import get_tile_op
+from .cgra_route import RoutingResource, encode_wire
+from .cgra_route import get_wire_bus, get_wire_track
 import networkx as nx
 import six
 
@@ -37,14 +40,18 @@ def deepcopy(obj_to_copy):
     return d
 
 
+def is_timed_element(blk_name, blk_id):
+    return ("reg" in blk_name or "mem" in blk_name or "io" in blk_name) and \
+        ("lut" not in blk_name and "cnst" not in blk_name and
+         blk_id[0] != "b")
+
+
 def find_all_timed_path(g, name_to_id, id_to_name, changed_pe):
     nodes = g.nodes()
     timed_elements = set()
 
     for node in nodes:
-        if ("reg" in node or "mem" in node or "io" in node) and \
-           ("lut" not in node and "cnst" not in node and
-           name_to_id[node][0] != "b"):
+        if is_timed_element(node, name_to_id[node]):
             timed_elements.add(node)
     # in case of reg folding
     for node in changed_pe:
@@ -140,13 +147,7 @@ def calculate_delay(net_path, route_result, placement, netlists, id_to_name,
         if src_port == "reg":
             add_time(src_pos, "reg", TIMING_INFO["reg"])
         else:
-            src_name = id_to_name[src_id]
-            # FIXME
-            if "mul" == src_name[:3]:
-                op = "mul"
-            else:
-                op, _ = get_tile_op(instances[src_name], src_id, changed_pe,
-                                    rename_op=False)
+            op = get_timing_op(src_id, id_to_name, instances, changed_pe)
             if op is not None:
                 add_time(src_pos, op, TIMING_INFO[op])
             else:
@@ -208,6 +209,119 @@ def calculate_delay(net_path, route_result, placement, netlists, id_to_name,
     return total_time, result
 
 
+def get_timing_op(blk_id, id_to_name, instances, changed_pe):
+    """the TIMING_INFO entry of the block, None if it's not timed"""
+    blk_name = id_to_name[blk_id]
+    # get_tile_op() without rename_op reports multipliers as "alu", so they
+    # are told apart by the "mul" prefix the frontend gives their instance
+    # names. a multiplier named otherwise is timed as an alu
+    if "mul" == blk_name[:3]:
+        return "mul"
+    op, _ = get_tile_op(instances[blk_name], blk_id, changed_pe,
+                        rename_op=False)
+    return op
+
+
+def get_blk_delay(blk_id, blk_port, id_to_name, instances, changed_pe):
+    """delay of the block driving a net through blk_port"""
+    if blk_port == "reg":
+        return TIMING_INFO["reg"]
+    op = get_timing_op(blk_id, id_to_name, instances, changed_pe)
+    if op is None:
+        return 0
+    return TIMING_INFO[op]
+
+
+def compute_net_criticality(netlists, blk_delay, timed_blks, wire_delay):
+    """static timing analysis on the packed netlists, which is linear instead
+       of enumerating every timed path. blk_delay is the delay of each block,
+       timed_blks the blocks where timed paths start and end and
+       wire_delay(net_id, dst) the delay from the net src to dst.
+       returns the criticality of each net, i.e. the delay of the longest
+       timed path through it over the critical path delay, and the critical
+       path delay"""
+    def get_node(blk_id, blk_port):
+        # registers, folded or not, are always timed
+        if blk_port == "reg":
+            return blk_id, blk_port
+        return blk_id
+
+    def get_delay(node):
+        if isinstance(node, tuple):
+            return TIMING_INFO["reg"]
+        return blk_delay.get(node, 0)
+
+    def is_timed(node):
+        return isinstance(node, tuple) or node in timed_blks
+
+    fanin = {}
+    fanout = {}
+    for net_id in netlists:
+        src = get_node(*netlists[net_id][0])
+        for dst in netlists[net_id][1:]:
+            delay = wire_delay(net_id, dst)
+            dst_node = get_node(*dst)
+            fanout.setdefault(src, []).append((net_id, dst_node, delay))
+            fanin.setdefault(dst_node, []).append((src, delay))
+    nodes = set(fanin.keys()) | set(fanout.keys())
+
+    # topological order of the combinational part. timed blocks don't
+    # propagate arrival time
+    in_degree = {}
+    for node in nodes:
+        if is_timed(node):
+            in_degree[node] = 0
+        else:
+            in_degree[node] = len(fanin.get(node, []))
+    working_set = [node for node in nodes if in_degree[node] == 0]
+    order = []
+    while len(working_set) > 0:
+        node = working_set.pop()
+        order.append(node)
+        for _, dst, _ in fanout.get(node, []):
+            if is_timed(dst):
+                continue
+            in_degree[dst] -= 1
+            if in_degree[dst] == 0:
+                working_set.append(dst)
+    # combinational loops, if any, are cut arbitrarily
+    ordered = set(order)
+    order += [node for node in nodes if node not in ordered]
+
+    # arrival time at the block output
+    arrival = {}
+    for node in order:
+        arrival_in = 0
+        if not is_timed(node):
+            for src, delay in fanin.get(node, []):
+                arrival_in = max(arrival_in, arrival.get(src, 0) + delay)
+        arrival[node] = get_delay(node) + arrival_in
+    # longest delay from the block output to a timed block
+    downstream = {}
+    for node in reversed(order):
+        downstream[node] = 0
+        for _, dst, delay in fanout.get(node, []):
+            if not is_timed(dst):
+                delay += get_delay(dst) + downstream.get(dst, 0)
+            downstream[node] = max(downstream[node], delay)
+
+    path_delay = {}
+    for src in fanout:
+        for net_id, dst, delay in fanout[src]:
+            if not is_timed(dst):
+                delay += get_delay(dst) + downstream[dst]
+            delay += arrival[src]
+            path_delay[net_id] = max(path_delay.get(net_id, 0), delay)
+    critical_delay = max(path_delay.values()) if path_delay else 0
+    criticality = {}
+    for net_id in path_delay:
+        if critical_delay > 0:
+            criticality[net_id] = path_delay[net_id] / critical_delay
+        else:
+            criticality[net_id] = 0
+    return criticality, critical_delay
+
+
 def find_critical_path_delay(netlist_json, packed_file, route_result,
                              placement):
     connections, instances = read_netlist_json(netlist_json)
@@ -361,64 +475,47 @@ def compute_routing_usage(routing_result, routing_resource, board_layout):
     for pos in routing_resource:
         route_resource[pos] = routing_resource[pos]["route_resource"]
     unused_route_resource = deepcopy(route_resource)
+    # only touches the connections of the used wires
+    used_resource = RoutingResource(routing_resource)
     for net_id in routing_result:
         path = routing_result[net_id]
         track_in = None
         for path_entry in path:
             if path_entry[0] == "src":
                 (pos, _), (track_out, track_in) = path_entry[1:]
+                track_out = encode_wire(*track_out)
+                track_in = encode_wire(*track_in)
                 # update left resource
-                chans = route_resource[pos]
-                conn_to_remove = set()
-                for conn_in, conn_out in chans:
-                    if conn_out == track_out:
-                        conn_to_remove.add((conn_in, conn_out))
-                for entry in conn_to_remove:
-                    chans.remove(entry)
+                used_resource.remove_conn_out(pos, track_out)
             elif path_entry[0] == "link":
                 assert (track_in is not None)
                 p1, p2 = path_entry[1]
-                conn_out, conn_in = path_entry[2]
-                chans = route_resource[p1]
-                conn_to_remove = set()
-                for c_in, c_out in chans:
-                    if track_in == c_in:
-                        conn_to_remove.add((c_in, c_out))
-                for entry in conn_to_remove:
-                    chans.remove(entry)
-                chans = route_resource[p2]
-                conn_to_remove = set()
-                for c_in, c_out in chans:
-                    if conn_out == c_out:
-                        conn_to_remove.add((c_in, c_out))
-                for entry in conn_to_remove:
-                    chans.remove(entry)
+                conn_out, conn_in = [encode_wire(*conn)
+                                     for conn in path_entry[2]]
+                used_resource.remove_conn_in(p1, track_in)
+                used_resource.remove_conn_out(p2, conn_out)
                 track_in = conn_in
             elif path_entry[0] == "sink":
                 if len(path_entry) == 3:
                     _, conn_in, (pos, _) = path_entry
-                    chans = route_resource[pos]
-                    conn_to_remove = set()
-                    for c_in, c_out in chans:
-                        if conn_in == c_in:
-                            conn_to_remove.add((c_in, c_out))
-                    for entry in conn_to_remove:
-                        chans.remove(entry)
+                    if isinstance(conn_in[0], tuple):
+                        # reg sink re-written by the reg net
+                        dir_out, conn_in = conn_in
+                        used_resource.remove_conn_out(pos,
+                                                      encode_wire(*dir_out))
+                    conn_in = encode_wire(*conn_in)
+                    used_resource.remove_conn_in(pos, conn_in)
                     track_in = conn_in
                 else:
                     link_entry = path_entry[1]
                     (pos, _), (conn_in, conn_out) = link_entry
-                    chans = route_resource[pos]
-                    conn_to_remove = set()
-                    for c_in, c_out in chans:
-                        if conn_in == c_in:
-                            conn_to_remove.add((c_in, c_out))
-                        if conn_out == c_out:
-                            conn_to_remove.add((c_in, c_out))
-                    for entry in conn_to_remove:
-                        chans.remove(entry)
+                    conn_in = encode_wire(*conn_in)
+                    conn_out = encode_wire(*conn_out)
+                    used_resource.remove_conn_in(pos, conn_in)
+                    used_resource.remove_conn_out(pos, conn_out)
 
                     track_in = conn_in
+    used_resource.commit()
 
     # this is indexed by bus, then track
     resource_usage = {}
@@ -431,17 +528,19 @@ def compute_routing_usage(routing_result, routing_resource, board_layout):
             total_resource = unused_route_resource[(x, y)]
             if len(total_bus) == 0:
                 for entry in total_resource:
-                    total_bus.add(entry[0][0])
-                    total_chan.add(entry[0][-1])
+                    total_bus.add(get_wire_bus(entry[0]))
+                    total_chan.add(get_wire_track(entry[0]))
             for bus in total_bus:
                 for chan in total_chan:
                     left = 0
                     total = 0
                     for entry in resource_left:
-                        if entry[0][0] == bus and entry[0][-1] == chan:
+                        if get_wire_bus(entry[0]) == bus and \
+                                get_wire_track(entry[0]) == chan:
                             left += 1
                     for entry in total_resource:
-                        if entry[0][0] == bus and entry[0][-1] == chan:
+                        if get_wire_bus(entry[0]) == bus and \
+                                get_wire_track(entry[0]) == chan:
                             total += 1
 
                     if bus not in resource_usage:
@@ -1,5 +1,7 @@
 from __future__ import print_function
 from lxml import etree
+import numpy as np
+import six
 import sys
 
 
@@ -143,14 +145,95 @@ def convert_bus_to_tuple(wire):
     return bus, in_out, side, track
 
 
+# wires, i.e. (bus, in/out, side, track), are packed into an int with 8 bits
+# for each field inside the routing resource and the router. the fields are
+# in the same order, so the ints sort the same way as the tuples. tuples are
+# only used in the routing result files
+def encode_wire(bus, io, side, track):
+    return (bus << 24) | (io << 16) | (side << 8) | track
+
+
+def decode_wire(wire):
+    return wire >> 24, (wire >> 16) & 0xFF, (wire >> 8) & 0xFF, wire & 0xFF
+
+
+def get_wire_bus(wire):
+    return wire >> 24
+
+
+def get_wire_io(wire):
+    return (wire >> 16) & 0xFF
+
+
+def get_wire_side(wire):
+    return (wire >> 8) & 0xFF
+
+
+def get_wire_track(wire):
+    return wire & 0xFF
+
+
+def convert_bus_to_wire(wire):
+    """same as convert_bus_to_tuple, but returns the packed wire"""
+    wire_info = convert_bus_to_tuple(wire)
+    if wire_info is None:
+        return None
+    return encode_wire(*wire_info)
+
+
+def convert_path_wires(path, convert):
+    """apply convert to every wire of a path in the router's path format"""
+    result = []
+    for pin_info in path:
+        if len(pin_info) == 1:
+            # src
+            p, port, dir_out, dir_in = pin_info[0]
+            result.append([(p, port, convert(dir_out), convert(dir_in))])
+        elif len(pin_info) == 2:
+            # passing through
+            (p1, dir_out), (p2, dir_in) = pin_info
+            result.append(((p1, convert(dir_out)), (p2, convert(dir_in))))
+        elif len(pin_info) == 3:
+            # direct sink. the port of a reg sink re-written by the reg net
+            # is a wire
+            conn, pos, port = pin_info
+            if not isinstance(port, six.string_types):
+                port = convert(port)
+            result.append((convert(conn), pos, port))
+        else:
+            # self-connection sink
+            dir_in, conn, pos, port = pin_info
+            result.append([convert(dir_in), convert(conn), pos, port])
+    return result
+
+
+def encode_path_wires(path):
+    """convert a path loaded by load_routing_result to packed wires"""
+    return convert_path_wires(path, lambda wire: encode_wire(*wire))
+
+
+def decode_path_wires(path):
+    """convert a path of the router to the wire tuples used by
+       save_routing_result"""
+    return convert_path_wires(path, decode_wire)
+
+
 def build_routing_resource(parsed_resource):
     """build routing resource so that we can pass it to a generic router
        raw string representation will be changed to
-       (bus, in/out, side, track), which can be directly used in the bitstream
-       generator
+       (bus, in/out, side, track) packed by encode_wire
     """
     # indexed by pos (x, y)
     result = {}
+    # wire name -> packed wire. besides skipping the parsing, every tile
+    # shares the same int objects
+    wire_cache = {}
+
+    def convert_wire(wire_name):
+        if wire_name not in wire_cache:
+            wire_cache[wire_name] = convert_bus_to_wire(wire_name)
+        return wire_cache[wire_name]
+
     for x, y in parsed_resource:
         entry = parsed_resource[(x, y)]
         if "cb" not in entry:
@@ -161,16 +244,16 @@ def build_routing_resource(parsed_resource):
             sink = "in"
             operands[sink] = set()
             for wire_info in input_channels:
-                wire = convert_bus_to_tuple(wire_info)
+                wire = convert_wire(wire_info)
                 if wire is not None:
-                    assert wire[1] == 0
+                    assert get_wire_io(wire) == 0
                     operands[sink].add(wire)
             sink = "out"
             operands[sink] = set()
             for wire_info in output_channels:
-                wire = convert_bus_to_tuple(wire_info)
+                wire = convert_wire(wire_info)
                 if wire is not None:
-                    assert wire[1] == 1
+                    assert get_wire_io(wire) == 1
                     operands[sink].add(wire)
 
             result[(x, y)] = {"route_resource": set(),
@@ -185,18 +268,18 @@ def build_routing_resource(parsed_resource):
                 operands[sink] = set()
                 wires = entry["cb"][bus][sink]
                 for wire in wires:
-                    wire_info = convert_bus_to_tuple(wire)
+                    wire_info = convert_wire(wire)
                     if wire_info is not None:
                         operands[sink].add(wire_info)
 
         for bus in entry["sb"]:
             muxes = entry["sb"][bus]["mux"]
             for sink in muxes:
-                sink_wire = convert_bus_to_tuple(sink)
+                sink_wire = convert_wire(sink)
                 if sink not in connections:
                     connections[sink] = set()
                 for wire in muxes[sink]:
-                    sink_info = convert_bus_to_tuple(wire)
+                    sink_info = convert_wire(wire)
                     if sink_info is not None:
                         connections[sink].add(sink_info)
                     elif wire[:2] == "pe":
@@ -216,7 +299,7 @@ def build_routing_resource(parsed_resource):
         # build real routing resources on the chip
         route_resource = set()
         for w1 in connections:
-            w1_info = convert_bus_to_tuple(w1)
+            w1_info = convert_wire(w1)
             for w2 in connections[w1]:
                 # NOTE:
                 # we might not use all the mem routing resource, which allows
@@ -228,6 +311,298 @@ def build_routing_resource(parsed_resource):
     return result
 
 
+class RoutingResource(dict):
+    """routing resource built by `build_routing_resource` whose removals are
+       journaled. a trial route records what it removes so that it can be
+       rolled back, and replayed later if it turns out to be the best one,
+       without ever copying the whole chip
+    """
+    def __init__(self, routing_resource):
+        dict.__init__(self, routing_resource)
+        # (pos, port, conn), where port is None for the route resource
+        self.journal = []
+        # optional compiled graph that mirrors the removals
+        self.graph = None
+        # per tile conn_in -> {conn_out} and conn_out -> {conn_in}, built
+        # when the tile is first touched
+        self.conn_in_index = {}
+        self.conn_out_index = {}
+        # optional count of the wires that can still be used as conn_in,
+        # indexed by (y, x, bus, track). see build_wire_map
+        self.wire_free = None
+        self.wire_capacity = None
+        self.wire_buses = None
+
+    def compile(self):
+        """build the compiled routing graph used by the router's search"""
+        if self.journal:
+            raise Exception("Cannot compile routing resource with " +
+                            "uncommitted removals")
+        self.graph = RoutingGraph(self)
+
+    def build_wire_map(self):
+        """count the wires of every tile that can still be used as conn_in.
+           wire_capacity keeps the counts at the time it's built, and
+           wire_free is kept up to date by commit"""
+        tile_wires = []
+        for (x, y) in self:
+            conn_in_set = set([conn_in for conn_in, _ in
+                               self[(x, y)]["route_resource"]])
+            tile_wires.append(((x, y), conn_in_set))
+        buses = set()
+        width = height = num_track = 0
+        for (x, y), conn_in_set in tile_wires:
+            width = max(width, x + 1)
+            height = max(height, y + 1)
+            for conn_in in conn_in_set:
+                buses.add(get_wire_bus(conn_in))
+                num_track = max(num_track, get_wire_track(conn_in) + 1)
+        self.wire_buses = sorted(buses)
+        bus_index = dict((bus, i) for i, bus in enumerate(self.wire_buses))
+        index = [(y, x, bus_index[get_wire_bus(conn_in)],
+                  get_wire_track(conn_in))
+                 for (x, y), conn_in_set in tile_wires
+                 for conn_in in conn_in_set]
+        self.wire_free = np.zeros((height, width, len(self.wire_buses),
+                                   num_track), dtype=np.int32)
+        if index:
+            np.add.at(self.wire_free, tuple(np.array(index).T), 1)
+        self.wire_capacity = self.wire_free.copy()
+
+    def __get_entry_set(self, pos, port):
+        if port is None:
+            return self[pos]["route_resource"]
+        else:
+            return self[pos]["port"][port]
+
+    def __get_conn_index(self, pos):
+        if pos not in self.conn_in_index:
+            conn_in_index = {}
+            conn_out_index = {}
+            for conn_in, conn_out in self[pos]["route_resource"]:
+                conn_in_index.setdefault(conn_in, set()).add(conn_out)
+                conn_out_index.setdefault(conn_out, set()).add(conn_in)
+            self.conn_in_index[pos] = conn_in_index
+            self.conn_out_index[pos] = conn_out_index
+        return self.conn_in_index[pos], self.conn_out_index[pos]
+
+    def __update_conn_index(self, pos, conn, add):
+        if pos not in self.conn_in_index:
+            return
+        conn_in, conn_out = conn
+        if add:
+            self.conn_in_index[pos].setdefault(conn_in, set()).add(conn_out)
+            self.conn_out_index[pos].setdefault(conn_out, set()).add(conn_in)
+        else:
+            self.conn_in_index[pos][conn_in].discard(conn_out)
+            self.conn_out_index[pos][conn_out].discard(conn_in)
+
+    def remove_conn(self, pos, conn):
+        """remove (conn_in, conn_out) from route resource at pos"""
+        route_resource = self[pos]["route_resource"]
+        if conn in route_resource:
+            route_resource.remove(conn)
+            self.journal.append((pos, None, conn))
+            self.__update_conn_index(pos, conn, False)
+            if self.graph is not None:
+                self.graph.set_conn(pos, conn, False)
+
+    def remove_conn_in(self, pos, conn_in):
+        """remove every (conn_in, *) from route resource at pos"""
+        conn_in_index, _ = self.__get_conn_index(pos)
+        for conn_out in list(conn_in_index.get(conn_in, ())):
+            self.remove_conn(pos, (conn_in, conn_out))
+
+    def remove_conn_out(self, pos, conn_out):
+        """remove every (*, conn_out) from route resource at pos"""
+        _, conn_out_index = self.__get_conn_index(pos)
+        for conn_in in list(conn_out_index.get(conn_out, ())):
+            self.remove_conn(pos, (conn_in, conn_out))
+
+    def remove_port_conn(self, pos, port, conn):
+        """remove conn from the channels connected to port at pos"""
+        port_conn = self[pos]["port"][port]
+        if conn in port_conn:
+            port_conn.remove(conn)
+            self.journal.append((pos, port, conn))
+            if self.graph is not None:
+                self.graph.set_port_conn(pos, port, conn, False)
+
+    def checkpoint(self):
+        return len(self.journal)
+
+    def rollback(self, checkpoint=0):
+        """undo every removal after the checkpoint. returns the removals so
+           that they can be replayed"""
+        entries = self.journal[checkpoint:]
+        for pos, port, conn in reversed(entries):
+            self.__get_entry_set(pos, port).add(conn)
+            if port is None:
+                self.__update_conn_index(pos, conn, True)
+            if self.graph is None:
+                continue
+            if port is None:
+                self.graph.set_conn(pos, conn, True)
+            else:
+                self.graph.set_port_conn(pos, port, conn, True)
+        del self.journal[checkpoint:]
+        return entries
+
+    def replay(self, entries):
+        for pos, port, conn in entries:
+            if port is None:
+                self.remove_conn(pos, conn)
+            else:
+                self.remove_port_conn(pos, port, conn)
+
+    def commit(self):
+        """make the removals permanent"""
+        if self.wire_free is not None:
+            self.__update_wire_map()
+        self.journal = []
+
+    def __update_wire_map(self):
+        # a conn_in with a removal in the journal was usable before it
+        conn_in_set = set()
+        for pos, port, conn in self.journal:
+            if port is None:
+                conn_in_set.add((pos, conn[0]))
+        for pos, conn_in in conn_in_set:
+            conn_in_index, _ = self.__get_conn_index(pos)
+            if len(conn_in_index.get(conn_in, ())) == 0:
+                x, y = pos
+                bus_index = self.wire_buses.index(get_wire_bus(conn_in))
+                self.wire_free[y, x, bus_index, get_wire_track(conn_in)] -= 1
+
+
+class RoutingGraph(object):
+    """compiled routing resource. every (pos, wire) is a node with an integer
+       id and the connections inside each tile are CSR adjacency arrays, i.e.
+       the out wires of node n are indices[indptr[n]:indptr[n + 1]], and
+       the reverse adjacency is kept the same way in rev_indptr and
+       rev_indices for backward search.
+       removals are mirrored by alive flags and the in/out degree of the
+       nodes, which are kept up to date by `RoutingResource`
+    """
+    # side -> tile offset. see Router.compute_direction
+    SIDE_OFFSET = {0: (1, 0), 1: (0, 1), 2: (-1, 0), 3: (0, -1)}
+
+    def __init__(self, routing_resource):
+        node_ids = {}
+        self.port_conn_ids = {}
+        src_nodes = []
+        dst_nodes = []
+        for pos in sorted(routing_resource):
+            route_resource = routing_resource[pos]["route_resource"]
+            for conn_in, conn_out in sorted(route_resource):
+                src_nodes.append(node_ids.setdefault((pos, conn_in),
+                                                     len(node_ids)))
+                dst_nodes.append(node_ids.setdefault((pos, conn_out),
+                                                     len(node_ids)))
+            port_resource = routing_resource[pos]["port"]
+            for port in sorted(port_resource):
+                for wire in sorted(port_resource[port]):
+                    node_ids.setdefault((pos, wire), len(node_ids))
+                    self.port_conn_ids[(pos, port, wire)] = \
+                        len(self.port_conn_ids)
+        num_nodes = len(node_ids)
+        self.node_ids = node_ids
+        self.node_pos = [None] * num_nodes
+        self.node_wires = [None] * num_nodes
+        for (pos, wire), node in node_ids.items():
+            self.node_pos[node] = pos
+            self.node_wires[node] = wire
+        src_nodes = np.array(src_nodes, dtype=np.int32)
+        dst_nodes = np.array(dst_nodes, dtype=np.int32)
+
+        # CSR adjacency
+        order = np.argsort(src_nodes, kind="mergesort")
+        self.out_degree = np.bincount(src_nodes, minlength=num_nodes)
+        self.in_degree = np.bincount(dst_nodes, minlength=num_nodes)
+        self.indptr = np.zeros(num_nodes + 1, dtype=np.int32)
+        np.cumsum(self.out_degree, out=self.indptr[1:])
+        self.indices = dst_nodes[order]
+        self.edge_ids = dict(zip(zip(src_nodes[order].tolist(),
+                                     self.indices.tolist()),
+                                 range(len(order))))
+        self.edge_alive = np.ones(len(order), dtype=np.bool_)
+        self.port_alive = np.ones(len(self.port_conn_ids), dtype=np.bool_)
+
+        # reverse CSR adjacency. rev_edges maps it back to the edge ids so
+        # that they share edge_alive
+        rev_order = np.argsort(dst_nodes, kind="mergesort")
+        edge_index = np.empty(len(order), dtype=np.int32)
+        edge_index[order] = np.arange(len(order), dtype=np.int32)
+        self.rev_indptr = np.zeros(num_nodes + 1, dtype=np.int32)
+        np.cumsum(self.in_degree, out=self.rev_indptr[1:])
+        self.rev_indices = src_nodes[rev_order]
+        self.rev_edges = edge_index[rev_order]
+
+        # switch box out -> in wire of the adjacent tile and the other way
+        # around
+        self.next_node = np.full(num_nodes, -1, dtype=np.int32)
+        self.prev_node = np.full(num_nodes, -1, dtype=np.int32)
+        for (pos, wire), node in self.node_ids.items():
+            bus, io, side, track = decode_wire(wire)
+            if side not in self.SIDE_OFFSET:
+                continue
+            dx, dy = self.SIDE_OFFSET[side]
+            adj_pos = (pos[0] + dx, pos[1] + dy)
+            adj_wire = encode_wire(bus, 1 - io, (side + 2) % 4, track)
+            adj_node = self.node_ids.get((adj_pos, adj_wire), -1)
+            if io == 1:
+                self.next_node[node] = adj_node
+            else:
+                self.prev_node[node] = adj_node
+
+    def get_node(self, pos, wire):
+        return self.node_ids.get((pos, wire), -1)
+
+    def get_conn_out(self, node):
+        """out wire nodes that node can still connect to"""
+        start = self.indptr[node]
+        end = self.indptr[node + 1]
+        return self.indices[start:end][self.edge_alive[start:end]]
+
+    def get_conn_in(self, node):
+        """in wire nodes that can still connect to node"""
+        start = self.rev_indptr[node]
+        end = self.rev_indptr[node + 1]
+        return self.rev_indices[start:end][
+            self.edge_alive[self.rev_edges[start:end]]]
+
+    def has_conn(self, pos, conn_in, conn_out):
+        edge = self.edge_ids.get((self.get_node(pos, conn_in),
+                                  self.get_node(pos, conn_out)), None)
+        return edge is not None and self.edge_alive[edge]
+
+    def has_conn_in(self, pos, wire):
+        """True if wire can still be used as a conn_in at pos"""
+        node = self.get_node(pos, wire)
+        return node >= 0 and self.out_degree[node] > 0
+
+    def has_conn_out(self, pos, wire):
+        """True if wire can still be used as a conn_out at pos"""
+        node = self.get_node(pos, wire)
+        return node >= 0 and self.in_degree[node] > 0
+
+    def has_port_conn(self, pos, port, wire):
+        index = self.port_conn_ids.get((pos, port, wire), None)
+        return index is not None and self.port_alive[index]
+
+    def set_conn(self, pos, conn, alive):
+        conn_in, conn_out = conn
+        src = self.node_ids[(pos, conn_in)]
+        dst = self.node_ids[(pos, conn_out)]
+        self.edge_alive[self.edge_ids[(src, dst)]] = alive
+        delta = 1 if alive else -1
+        self.out_degree[src] += delta
+        self.in_degree[dst] += delta
+
+    def set_port_conn(self, pos, port, wire, alive):
+        self.port_alive[self.port_conn_ids[(pos, port, wire)]] = alive
+
+
 def simple_route_stats(parsed_routing_resource):
     """This one takes parsed routing resource, not the ones
        built for router
@@ -0,0 +1,261 @@
+from __future__ import print_function
+import mmap
+import os
+import struct
+
+
+# binary routing result layout, all little endian:
+#   header:  magic, version, number of nets, offset of the trailer
+#   records: one per net, length prefixed so that readers can skip it.
+#            net id, number of entries and the entries themselves
+#   trailer: port name table followed by the (net id, record offset) index
+# positions are stored as (int16, int16) and wires as
+# (bus, io, side, track) uint8s. ports are indices into the port table
+MAGIC = b"CGRAROUT"
+VERSION = 1
+
+HEADER = struct.Struct("<8sIIQ")
+COUNT = struct.Struct("<I")
+STR_LEN = struct.Struct("<H")
+OFFSET = struct.Struct("<Q")
+KIND = struct.Struct("<B")
+
+# entry kinds, following the path format used by the router
+SRC = 0
+LINK = 1
+SINK = 2
+REG_SINK = 3
+SELF_SINK = 4
+
+ENTRY_STRUCTS = {
+    # pos, port, dir_out, dir_in
+    SRC: struct.Struct("<hhH4B4B"),
+    # p1, p2, dir_out, dir_in
+    LINK: struct.Struct("<hhhh4B4B"),
+    # conn, pos, port
+    SINK: struct.Struct("<4BhhH"),
+    # conn, pos, dir_out
+    REG_SINK: struct.Struct("<4Bhh4B"),
+    # dir_in, conn, pos, port
+    SELF_SINK: struct.Struct("<4B4BhhH"),
+}
+
+
+def is_binary_routing_file(routing_file):
+    with open(routing_file, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def get_binary_routing_filename(routing_file):
+    """companion binary file of a text routing result"""
+    return os.path.splitext(routing_file)[0] + ".broute"
+
+
+def check_wire(wire):
+    if len(wire) != 4:
+        raise Exception("Invalid wire " + str(wire))
+    return wire
+
+
+def path_to_entries(path):
+    """convert the path format used by the router into the one returned by
+       parse_routing_result"""
+    entries = []
+    for conn in path:
+        if len(conn) == 1:
+            pos, port, dir_out, dir_in = conn[0]
+            entries.append(("src", (pos, port), (dir_out, dir_in)))
+        elif len(conn) == 2:
+            (p1, dir_out), (p2, dir_in) = conn
+            entries.append(("link", (p1, p2), (dir_out, dir_in)))
+        elif len(conn) == 3:
+            conn, pos, port = conn
+            if isinstance(port, tuple):
+                entries.append(("sink", (port, conn), (pos, "reg")))
+            else:
+                entries.append(("sink", conn, (pos, port)))
+        else:
+            dir_in, conn, pos, port = conn
+            entries.append(("sink", ((pos, pos), (dir_in, conn)), conn,
+                            (pos, port)))
+    return entries
+
+
+class RoutingResultWriter(object):
+    """writes a binary routing result net by net. use it as a context manager
+       or call close() to finish the file"""
+    def __init__(self, output_file):
+        self.f = open(output_file, "wb")
+        self.ports = []
+        self.port_index = {}
+        self.net_offsets = []
+        self.f.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __get_port(self, port):
+        port = str(port)
+        if port not in self.port_index:
+            self.port_index[port] = len(self.ports)
+            self.ports.append(port)
+        return self.port_index[port]
+
+    def __pack_entry(self, conn):
+        if len(conn) == 1:
+            pos, port, dir_out, dir_in = conn[0]
+            return KIND.pack(SRC) + ENTRY_STRUCTS[SRC].pack(
+                pos[0], pos[1], self.__get_port(port),
+                *(check_wire(dir_out) + check_wire(dir_in)))
+        elif len(conn) == 2:
+            (p1, dir_out), (p2, dir_in) = conn
+            return KIND.pack(LINK) + ENTRY_STRUCTS[LINK].pack(
+                p1[0], p1[1], p2[0], p2[1],
+                *(check_wire(dir_out) + check_wire(dir_in)))
+        elif len(conn) == 3:
+            conn, pos, port = conn
+            if isinstance(port, tuple):
+                return KIND.pack(REG_SINK) + ENTRY_STRUCTS[REG_SINK].pack(
+                    *(check_wire(conn) + pos + check_wire(port)))
+            return KIND.pack(SINK) + ENTRY_STRUCTS[SINK].pack(
+                *(check_wire(conn) + pos + (self.__get_port(port),)))
+        elif len(conn) == 4:
+            dir_in, conn, pos, port = conn
+            return KIND.pack(SELF_SINK) + ENTRY_STRUCTS[SELF_SINK].pack(
+                *(check_wire(dir_in) + check_wire(conn) + pos +
+                  (self.__get_port(port),)))
+        raise Exception("Unknown path entry " + str(conn))
+
+    def write_net(self, net_id, path):
+        net_id = net_id.encode()
+        data = [STR_LEN.pack(len(net_id)), net_id, COUNT.pack(len(path))]
+        for conn in path:
+            data.append(self.__pack_entry(conn))
+        data = b"".join(data)
+        self.net_offsets.append((net_id, self.f.tell()))
+        self.f.write(COUNT.pack(len(data)))
+        self.f.write(data)
+
+    def close(self):
+        if self.f is None:
+            return
+        trailer_offset = self.f.tell()
+        self.f.write(COUNT.pack(len(self.ports)))
+        for port in self.ports:
+            port = port.encode()
+            self.f.write(STR_LEN.pack(len(port)))
+            self.f.write(port)
+        for net_id, offset in self.net_offsets:
+            self.f.write(STR_LEN.pack(len(net_id)))
+            self.f.write(net_id)
+            self.f.write(OFFSET.pack(offset))
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, VERSION, len(self.net_offsets),
+                                 trailer_offset))
+        self.f.close()
+        self.f = None
+
+
+class RoutingResultFile(object):
+    """memory-mapped binary routing result. behaves like the dict returned by
+       parse_routing_result, but only decodes a net when it is accessed"""
+    def __init__(self, routing_file):
+        with open(routing_file, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_nets, trailer_offset = \
+            HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise Exception(routing_file + " is not a binary routing result")
+        if version != VERSION:
+            raise Exception("Unsupported routing result version " +
+                            str(version))
+        offset = trailer_offset
+        num_ports, = COUNT.unpack_from(self.buf, offset)
+        offset += COUNT.size
+        self.ports = []
+        for _ in range(num_ports):
+            port, offset = self.__read_str(offset)
+            self.ports.append(port)
+        # net id -> record offset, in file order
+        self.net_ids = []
+        self.offsets = {}
+        for _ in range(num_nets):
+            net_id, offset = self.__read_str(offset)
+            self.offsets[net_id], = OFFSET.unpack_from(self.buf, offset)
+            offset += OFFSET.size
+            self.net_ids.append(net_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.buf.close()
+
+    def __read_str(self, offset):
+        length, = STR_LEN.unpack_from(self.buf, offset)
+        offset += STR_LEN.size
+        return str(self.buf[offset:offset + length].decode()), offset + length
+
+    def get_path(self, net_id):
+        """the route of the net in the path format used by the router"""
+        offset = self.offsets[net_id] + COUNT.size
+        _, offset = self.__read_str(offset)
+        num_entries, = COUNT.unpack_from(self.buf, offset)
+        offset += COUNT.size
+        path = []
+        for _ in range(num_entries):
+            kind, = KIND.unpack_from(self.buf, offset)
+            offset += KIND.size
+            entry_struct = ENTRY_STRUCTS[kind]
+            v = entry_struct.unpack_from(self.buf, offset)
+            offset += entry_struct.size
+            if kind == SRC:
+                path.append([((v[0], v[1]), self.ports[v[2]], v[3:7],
+                              v[7:11])])
+            elif kind == LINK:
+                path.append((((v[0], v[1]), v[4:8]), ((v[2], v[3]), v[8:12])))
+            elif kind == SINK:
+                path.append((v[0:4], (v[4], v[5]), self.ports[v[6]]))
+            elif kind == REG_SINK:
+                path.append((v[0:4], (v[4], v[5]), v[6:10]))
+            else:
+                path.append([v[0:4], v[4:8], (v[8], v[9]),
+                             self.ports[v[10]]])
+        return path
+
+    def iter_paths(self):
+        for net_id in self.net_ids:
+            yield net_id, self.get_path(net_id)
+
+    def __getitem__(self, net_id):
+        return path_to_entries(self.get_path(net_id))
+
+    def __contains__(self, net_id):
+        return net_id in self.offsets
+
+    def __iter__(self):
+        return iter(self.net_ids)
+
+    def __len__(self):
+        return len(self.net_ids)
+
+    def keys(self):
+        return list(self.net_ids)
+
+    def items(self):
+        for net_id in self.net_ids:
+            yield net_id, self[net_id]
+
+
+def save_binary_routing_result(route_result, output_file):
+    net_id_list = list(route_result.keys())
+    net_id_list.sort(key=lambda x: int(x[1:]))
+    with RoutingResultWriter(output_file) as writer:
+        for net_id in net_id_list:
+            writer.write_net(net_id, route_result[net_id])
@@ -0,0 +1,24 @@
+from __future__ import print_function
+import sys
+from arch.cgra import load_routing_result, save_routing_result
+from arch.route_file import is_binary_routing_file, save_binary_routing_result
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage:", sys.argv[0], "<input.route|input.broute>",
+              "<output.route|output.broute>", file=sys.stderr)
+        print("Converts between the text and the binary routing result",
+              file=sys.stderr)
+        exit(1)
+    input_file = sys.argv[1]
+    output_file = sys.argv[2]
+    route_result = load_routing_result(input_file)
+    if is_binary_routing_file(input_file):
+        save_routing_result(route_result, output_file)
+    else:
+        save_binary_routing_result(route_result, output_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+from __future__ import print_function, division
+from argparse import ArgumentParser
+import csv
+import os
+import subprocess
+import sys
+import time
+
+MOCK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(MOCK_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from arch import parse_routing_result, compute_total_wire  # noqa: E402
+
+
+STAGES = ["hardware", "netlist", "pack", "embed", "place", "route"]
+FIELDS = ["commit", "name", "size", "num_track", "seed", "num_kernel",
+          "status", "wirelength", "peak_rss", "route_rss"] + \
+         [stage + "_time" for stage in STAGES]
+
+
+def get_commit():
+    """current commit of the repo, marked dirty if it has local changes"""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short",
+                                          "HEAD"], cwd=ROOT_DIR)
+        commit = commit.decode().strip()
+        status = subprocess.check_output(["git", "status", "--porcelain",
+                                          "--untracked-files=no"],
+                                         cwd=ROOT_DIR)
+        if len(status.strip()) > 0:
+            commit += "-dirty"
+        return commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_stage(cmd, log_filename):
+    """run the command with its output going to the log file. returns the
+       exit code, wall time and peak RSS in KB"""
+    with open(log_filename, "w") as log:
+        log.write(" ".join(cmd) + "\n")
+        log.flush()
+        start = time.time()
+        p = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 instead of wait so that we get the rusage of this child only
+        _, status, rusage = os.wait4(p.pid, 0)
+        wall_time = time.time() - start
+    if os.WIFEXITED(status):
+        exit_code = os.WEXITSTATUS(status)
+    else:
+        exit_code = -os.WTERMSIG(status)
+    # already reaped
+    p.returncode = exit_code
+    return exit_code, wall_time, rusage.ru_maxrss
+
+
+def get_num_kernel(size, kernel_size, density):
+    """scale the number of kernels with the board area"""
+    return max(1, int(round(size * size * density / kernel_size)))
+
+
+def get_num_io(num_kernel):
+    """every kernel may come with its own input and output"""
+    return max(4, 2 * num_kernel)
+
+
+def run_benchmark(size, num_track, seed, kernel_size, density, work_dir,
+                  router_args):
+    name = "mock_s{0}_t{1}_{2}".format(size, num_track, seed)
+    num_kernel = get_num_kernel(size, kernel_size, density)
+    num_io = get_num_io(num_kernel)
+    prefix = os.path.join(work_dir, name)
+    arch_filename = os.path.join(work_dir, "cgra_s{0}_t{1}_io{2}.xml".format(
+        size, num_track, num_io))
+    netlist_filename = prefix + ".json"
+    packed_filename = prefix + ".packed"
+    emb_filename = prefix + ".emb"
+    place_filename = prefix + ".place"
+    route_filename = prefix + ".route"
+    python = sys.executable
+    stages = {
+        "hardware": [python, os.path.join(MOCK_DIR, "generate_hardware.py"),
+                     "-s", str(size), "--num_track", str(num_track),
+                     "--num_io", str(num_io), "-o", arch_filename],
+        "netlist": [python, os.path.join(MOCK_DIR, "generate_netlist.py"),
+                    "-s", str(seed), "--num_kernel", str(num_kernel),
+                    "--kernel_size", str(kernel_size),
+                    "-o", netlist_filename],
+        "pack": [python, os.path.join(ROOT_DIR, "packer.py"),
+                 "-n", netlist_filename, "-o", packed_filename],
+        "embed": [python, os.path.join(ROOT_DIR, "random_walk.py"),
+                  "-i", packed_filename, "-o", emb_filename],
+        "place": [python, os.path.join(ROOT_DIR, "place.py"),
+                  "--cgra", arch_filename, "-i", packed_filename,
+                  "-e", emb_filename, "-o", place_filename, "--no-vis"],
+        "route": [python, os.path.join(ROOT_DIR, "router.py"),
+                  "-c", arch_filename, "-i", packed_filename,
+                  "-p", place_filename, "-o", route_filename,
+                  "--no-vis"] + router_args,
+    }
+
+    result = {"commit": get_commit(), "name": name, "size": size,
+              "num_track": num_track, "seed": seed, "num_kernel": num_kernel,
+              "status": "ok", "wirelength": "", "peak_rss": 0,
+              "route_rss": ""}
+    for stage in STAGES:
+        if stage == "hardware" and os.path.isfile(arch_filename):
+            # shared by every benchmark of the same size
+            result[stage + "_time"] = 0
+            continue
+        log_filename = prefix + "." + stage + ".log"
+        exit_code, wall_time, peak_rss = run_stage(stages[stage],
+                                                   log_filename)
+        result[stage + "_time"] = round(wall_time, 3)
+        result["peak_rss"] = max(result["peak_rss"], peak_rss)
+        if stage == "route":
+            result["route_rss"] = peak_rss
+        if exit_code != 0:
+            result["status"] = "{0} failed ({1})".format(stage, exit_code)
+            break
+    if result["status"] == "ok":
+        wire_length = compute_total_wire(parse_routing_result(route_filename))
+        result["wirelength"] = sum(wire_length.values())
+    return result
+
+
+def print_results(results, baseline=None):
+    """print the results as a table. if baseline results are given, route
+       time and wirelength are compared by benchmark name"""
+    columns = ["name", "status", "place_time", "route_time", "route_rss",
+               "wirelength"]
+    if baseline is not None:
+        columns += ["route_speedup", "wirelength_diff"]
+    rows = []
+    for result in results:
+        row = dict(result)
+        base = baseline.get(result["name"]) if baseline is not None else None
+        if base is not None and base["status"] == "ok" and \
+                result["status"] == "ok":
+            row["route_speedup"] = "{0:.2f}x".format(
+                float(base["route_time"]) / max(result["route_time"], 1e-6))
+            row["wirelength_diff"] = result["wirelength"] - \
+                int(base["wirelength"])
+        rows.append([str(row.get(column, "")) for column in columns])
+    widths = [max([len(column)] + [len(row[i]) for row in rows])
+              for i, column in enumerate(columns)]
+    print("  ".join([column.ljust(width)
+                     for column, width in zip(columns, widths)]))
+    for row in rows:
+        print("  ".join([entry.ljust(width)
+                         for entry, width in zip(row, widths)]))
+
+
+def load_results(filename):
+    """latest result of each benchmark in the results file"""
+    results = {}
+    with open(filename) as f:
+        for row in csv.DictReader(f):
+            results[row["name"]] = row
+    return results
+
+
+def main():
+    parser = ArgumentParser("Mock PnR benchmark. Generates mock " +
+                            "architectures and netlists, runs the whole " +
+                            "PnR flow on them and records the results")
+    parser.add_argument("-s", "--sizes", help="Comma separated board " +
+                        "sizes", default="8,16,32,64", action="store",
+                        dest="sizes")
+    parser.add_argument("--num_track", help="Comma separated number of " +
+                        "tracks", default="5", action="store",
+                        dest="num_tracks")
+    parser.add_argument("--seeds", help="Comma separated netlist seeds",
+                        default="0", action="store", dest="seeds")
+    parser.add_argument("--kernel_size", help="Expected kernel size",
+                        default=20, type=int, action="store",
+                        dest="kernel_size")
+    parser.add_argument("--density", help="Expected number of blocks " +
+                        "per tile, which scales the number of kernels with " +
+                        "the board size", default=0.3, type=float,
+                        action="store", dest="density")
+    parser.add_argument("-d", "--dir", help="Working directory for the " +
+                        "generated files and logs", default="bench",
+                        action="store", dest="work_dir")
+    parser.add_argument("-o", "--output", help="Results file. Results are " +
+                        "appended to it", default="bench.csv",
+                        action="store", dest="output_file")
+    parser.add_argument("--compare", help="Results file of another commit " +
+                        "to compare against", default=None, action="store",
+                        dest="baseline_file")
+    parser.add_argument("--router-args", help="Extra arguments passed to " +
+                        "the router, e.g. --router-args=\"--steiner\"",
+                        default="", action="store", dest="router_args")
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    num_tracks = [int(x) for x in args.num_tracks.split(",")]
+    seeds = [int(x) for x in args.seeds.split(",")]
+    router_args = args.router_args.split()
+    baseline = None
+    if args.baseline_file is not None:
+        baseline = load_results(args.baseline_file)
+    if not os.path.isdir(args.work_dir):
+        os.makedirs(args.work_dir)
+
+    write_header = not os.path.isfile(args.output_file)
+    if not write_header:
+        with open(args.output_file) as f:
+            if next(csv.reader(f), None) != FIELDS:
+                raise Exception("Incompatible results file " +
+                                args.output_file)
+    results = []
+    with open(args.output_file, "a") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if write_header:
+            writer.writeheader()
+        for size in sizes:
+            for num_track in num_tracks:
+                for seed in seeds:
+                    result = run_benchmark(size, num_track, seed,
+                                           args.kernel_size, args.density,
+                                           args.work_dir, router_args)
+                    print(result["name"], result["status"],
+                          "route:", result.get("route_time", ""), "s")
+                    writer.writerow(result)
+                    f.flush()
+                    results.append(result)
+    print_results(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
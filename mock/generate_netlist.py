@@ -309,36 +309,37 @@ def main():
     parser.add_argument("-s", "--seed", help="RND seed",
                         default=0, type=int, action="store", dest="seed")
     parser.add_argument("--const-rate", help="How often does const value " +
-                        "appear", default=0.2, action="store",
+                        "appear", default=0.2, type=float, action="store",
                         dest="const_rate")
     parser.add_argument("--reg_reg_rate", help="How likely to build up " +
-                        "reg to reg chain", default=0.2, action="store",
-                        dest="reg_reg_rate")
+                        "reg to reg chain", default=0.2, type=float,
+                        action="store", dest="reg_reg_rate")
     parser.add_argument("--num_kernel", help="Number of kernels",
                         default=5, type=int, action="store", dest="num_kernel")
     parser.add_argument("--kernel_size", help="Expected kernel size",
-                        default=20, action="store", dest="kernel_size")
+                        default=20, type=int, action="store",
+                        dest="kernel_size")
     parser.add_argument("--kernel_size_variance",
                         help="Variance of kernel size (uniform distribution)",
-                        default=4, action="store",
+                        default=4, type=int, action="store",
                         dest="num_kernel_variance")
     parser.add_argument("--expected_num_reg",
                         help="Expected number of registers per kernel",
-                        default=5, action="store",
+                        default=5, type=int, action="store",
                         dest="expected_num_reg")
     parser.add_argument("--num_reg_variance",
                         help="Variance of number of registers per kernel " +
                         "(uniform distribution)",
-                        default=2, action="store",
+                        default=2, type=int, action="store",
                         dest="num_reg_variance")
     parser.add_argument("--expected_num_mem",
                         help="Expected number of line buffers per kernel",
-                        default=2, action="store",
+                        default=2, type=int, action="store",
                         dest="expected_num_mem")
     parser.add_argument("--num_mem_variance",
                         help="Variance of number of line buffers per kernel " +
-                        "(uniform distribution)", default=1, action="store",
-                        dest="num_mem_variance")
+                        "(uniform distribution)", default=1, type=int,
+                        action="store", dest="num_mem_variance")
 
     args = parser.parse_args()
     # random seed
@@ -1,16 +1,21 @@
 from __future__ import print_function
 
-from util import reduce_cluster_graph, compute_centroids
+from util import reduce_cluster_graphs, compute_centroids
 from util import SetEncoder, choose_resource
+from util import compute_hpwl, compute_mst_length
+from abc import ABCMeta, abstractmethod
 import os
 import random
+import multiprocessing
 import pythunder
 import json
-import threading
+import six
 
 
-def detailed_placement_thunder(args, context=None):
-    blks = list(args["clusters"])
+def make_detailed_placer(args):
+    # blocks and cells are sorted so that the placement doesn't depend on
+    # the set order
+    blks = sorted(args["clusters"])
     cells = args["cells"]
     netlist = args["new_netlist"]
     blk_pos = args["blk_pos"]
@@ -21,9 +26,16 @@ def detailed_placement_thunder(args, context=None):
     fixed_pos = {}
     for blk_id in blk_pos:
         fixed_pos[blk_id] = list(blk_pos[blk_id])
-    placer = pythunder.DetailedPlacer(blks, netlist, cells,
-                                      fixed_pos, clb_type,
-                                      fold_reg)
+    new_cells = {}
+    for blk_type in cells:
+        new_cells[blk_type] = sorted([tuple(pos) for pos in cells[blk_type]])
+    return pythunder.DetailedPlacer(blks, netlist, new_cells,
+                                    fixed_pos, clb_type,
+                                    fold_reg)
+
+
+def detailed_placement_thunder(args, context=None):
+    placer = make_detailed_placer(args)
     placer.anneal()
     placer.refine(1000, 0.01, False)
     placement = placer.realize()
@@ -43,45 +55,135 @@ def detailed_placement_thunder(args, context=None):
 
 
 def estimate_placement_time(args):
-    blks = list(args["clusters"])
-    cells = args["cells"]
-    netlist = args["new_netlist"]
-    blk_pos = args["blk_pos"]
-    fold_reg = args["fold_reg"]
-    clb_type = args["clb_type"]
-    fixed_pos = {}
-    for blk_id in blk_pos:
-        fixed_pos[blk_id] = list(blk_pos[blk_id])
-    new_cells = {}
-    for blk_type in cells:
-        new_cells[blk_type] = list(cells[blk_type])
-    placer = pythunder.DetailedPlacer(blks, netlist, new_cells,
-                                      fixed_pos, clb_type,
-                                      fold_reg)
-    t = placer.estimate(10000)
-    return t
-
-
-def get_lambda_arn(map_args, aws_config):
-    from six.moves import queue
-    threads = []
-    que = queue.Queue()
-    for i in range(len(map_args)):
-        t = threading.Thread(target=lambda q, arg, index: q.put(
-            (index, estimate_placement_time(arg))), args=(que, map_args[i], i))
-        threads.append(t)
-    for t in threads:
-        t.start()
-    for t in threads:
-        t.join()
-    estimates = [-1] * len(map_args)
-    while not que.empty():
-        index, estimate = que.get()
-        estimates[index] = estimate
-
-    for t in estimates:
-        assert t != -1
-    return choose_resource(estimates, aws_config)
+    placer = make_detailed_placer(args)
+    return placer.estimate()
+
+
+def estimate_placement_times(map_args, jobs=None):
+    """estimated detailed placement time of every cluster, computed in
+       worker processes unless there is a single job"""
+    from concurrent.futures import ProcessPoolExecutor
+    if jobs == 1:
+        return [estimate_placement_time(args) for args in map_args]
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(estimate_placement_time, map_args))
+
+
+class PlacementExecutor(six.with_metaclass(ABCMeta, object)):
+    """runs the detailed placement of clusters. subclasses implement
+       submit(), which returns a concurrent.futures.Future of the placement
+       of one cluster"""
+    def __init__(self, jobs=None):
+        self.jobs = jobs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    @abstractmethod
+    def submit(self, index, args):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def place(self, map_args):
+        """start the clusters, the ones with the largest estimated time first
+           so that they don't hold up the rest. returns the futures in the
+           order of map_args"""
+        estimates = self.estimate(map_args)
+        self.prepare(estimates)
+        index_list = list(range(len(map_args)))
+        index_list.sort(key=lambda x: estimates[x], reverse=True)
+        futures = [None] * len(map_args)
+        for i in index_list:
+            futures[i] = self.submit(i, map_args[i])
+        return futures
+
+    def estimate(self, map_args):
+        return estimate_placement_times(map_args, self.jobs)
+
+    def prepare(self, estimates):
+        pass
+
+
+class LocalExecutor(PlacementExecutor):
+    """places clusters in local worker processes. with a single job they
+       are placed in this process instead"""
+    def __init__(self, jobs=None):
+        PlacementExecutor.__init__(self, jobs)
+        self.pool = None
+        if jobs != 1:
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(jobs)
+
+    def estimate(self, map_args):
+        if self.pool is None:
+            # the order doesn't matter if they're placed one by one
+            return [0] * len(map_args)
+        return PlacementExecutor.estimate(self, map_args)
+
+    def submit(self, index, args):
+        if self.pool is not None:
+            return self.pool.submit(detailed_placement_thunder, args)
+        from concurrent.futures import Future
+        future = Future()
+        future.set_result(detailed_placement_thunder(args))
+        return future
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+def invoke_lambda(arn, payload):
+    import boto3
+    # user need to specify a region in the environment
+    client = boto3.client("lambda")
+    return client.invoke(FunctionName=arn,
+                         InvocationType="RequestResponse",
+                         Payload=payload)["Payload"].read()
+
+
+def invoke_local(arn, payload):
+    """local stand-in for the Lambda function, which takes and returns the
+       same JSON payload"""
+    result = detailed_placement_thunder(json.loads(payload), context=arn)
+    return json.dumps(result).encode()
+
+
+class LambdaExecutor(PlacementExecutor):
+    """places clusters with the serverless functions listed in the
+       configuration file. the function memory size is picked based on the
+       estimated time. invoke(arn, payload) calls the function and defaults
+       to AWS Lambda"""
+    def __init__(self, aws_config, invoke=None, jobs=None):
+        PlacementExecutor.__init__(self, jobs)
+        self.aws_config = aws_config
+        self.invoke = invoke if invoke is not None else invoke_lambda
+        self.resources = {}
+        self.pool = None
+
+    def prepare(self, estimates):
+        from concurrent.futures import ThreadPoolExecutor
+        self.resources = choose_resource(estimates, self.aws_config)
+        # one thread per cluster, which only waits on the remote function
+        self.pool = ThreadPoolExecutor(max(1, len(estimates)))
+
+    def run(self, arn, args):
+        payload = json.dumps(args, cls=SetEncoder).encode()
+        return json.loads(self.invoke(arn, payload))["body"]
+
+    def submit(self, index, args):
+        return self.pool.submit(self.run, self.resources[index][1], args)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
 
 
 def refine_global_thunder(board_meta, pre_placement, netlists, fixed_pos,
@@ -113,12 +215,90 @@ def refine_global_thunder(board_meta, pre_placement, netlists, fixed_pos,
     return global_refine.realize()
 
 
+def place_design(design, seed, vis=False):
+    """global placement, detailed placement and refinement of the design
+       with the given seed. returns the board positions"""
+    import numpy as np
+    # just in case for some library
+    random.seed(seed)
+    np.random.seed(seed)
+
+    centroids, cluster_cells, clusters = perform_global_placement(
+        design["blks"], design["data_x"], design["emb"],
+        design["fixed_blk_pos"], design["netlists"], design["board_meta"],
+        fold_reg=design["fold_reg"], num_clusters=design["num_clusters"],
+        seed=seed, fpga_place=design["fpga_place"], vis=vis)
+
+    # placer with each cluster
+    board_pos = perform_detailed_placement(centroids,
+                                           cluster_cells, clusters,
+                                           design["fixed_blk_pos"],
+                                           design["netlists"],
+                                           design["fold_reg"], seed,
+                                           design["board_meta"][-1],
+                                           design["aws_config"],
+                                           jobs=design["jobs"])
+    # refinement
+    board_pos = refine_global_thunder(design["board_meta"], board_pos,
+                                      design["netlists"],
+                                      design["fixed_blk_pos"],
+                                      design["fold_reg"])
+    return board_pos
+
+
+def score_placement(netlists, board_pos, score="hpwl"):
+    if score == "mst":
+        return compute_mst_length(netlists, board_pos)
+    return compute_hpwl(netlists, board_pos)
+
+
+seed_design = None
+
+
+def init_seed_worker(design):
+    global seed_design
+    seed_design = design
+
+
+def place_seed_worker(task):
+    """place the design inherited from the parent with one seed"""
+    seed, score = task
+    result = {"seed": seed, "status": "ok", "board_pos": None,
+              "score": None}
+    try:
+        board_pos = place_design(seed_design, seed)
+    except Exception as ex:
+        result["status"] = str(ex)
+        return result
+    result["board_pos"] = board_pos
+    result["score"] = score_placement(seed_design["netlists"], board_pos,
+                                      score)
+    return result
+
+
+def place_seeds(design, seeds, jobs=1, score="hpwl"):
+    """place the design with every seed in a pool of workers forked from the
+       parent, so the parsed design is shared. returns the result of every
+       seed"""
+    tasks = [(seed, score) for seed in seeds]
+    pool = multiprocessing.Pool(jobs, initializer=init_seed_worker,
+                                initargs=(design,))
+    results = []
+    try:
+        for result in pool.imap(place_seed_worker, tasks):
+            results.append(result)
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
 def main():
     # only the main thread needs it
     import numpy as np
     from argparse import ArgumentParser
     from arch.parser import parse_emb
-    from arch import make_board, parse_cgra, generate_place_on_board, parse_fpga
+    from arch import make_board, load_cgra, generate_place_on_board, parse_fpga
     from arch.cgra import place_special_blocks, save_placement, prune_netlist
     from arch.cgra_packer import load_packed_file
     from arch.fpga import load_packed_fpga_netlist
@@ -150,6 +330,19 @@ def main():
                                              "default is 0", type=int,
                         default=0,
                         required=False, action="store", dest="seed")
+    parser.add_argument("--num-seeds", help="Number of seeds to place " +
+                        "with, starting from --seed. Only the best " +
+                        "placement is saved", type=int, default=1,
+                        required=False, action="store", dest="num_seeds")
+    parser.add_argument("--jobs", help="Number of seeds placed in " +
+                        "parallel", type=int, default=1,
+                        required=False, action="store", dest="jobs")
+    parser.add_argument("--score", help="How the best seed is picked, " +
+                        "either hpwl or mst, the length of the minimum " +
+                        "spanning tree of each net, which is closer to " +
+                        "the routed wire length",
+                        choices=["hpwl", "mst"], action="store",
+                        required=False, dest="score", default="hpwl")
 
     parser.add_argument("-a", "--aws", help="Serverless configuration for " +
                         "detailed placement. If set, will try to connect to "
@@ -169,6 +362,8 @@ def main():
 
     if len(cgra_arch) == 0 ^ len(fpga_arch) == 0 and mock_size == 0:
         parser.error("Must provide wither --fpga or --cgra")
+    if args.num_seeds < 1 or args.jobs < 1:
+        parser.error("--num-seeds and --jobs must be positive")
 
     packed_filename = args.packed_filename
     netlist_embedding = args.netlist_embedding
@@ -177,10 +372,7 @@ def main():
     fpga_place = len(fpga_arch) > 0
 
     seed = args.seed
-    print("Using seed", seed, "for placement")
-    # just in case for some library
-    random.seed(seed)
-    np.random.seed(seed)
+    num_seeds = args.num_seeds
 
     vis_opt = not args.no_vis
     fold_reg = not args.no_reg_fold
@@ -192,14 +384,13 @@ def main():
         fold_reg = False
         board_meta = parse_fpga(fpga_arch)
     else:
-        board_meta = parse_cgra(cgra_arch, fold_reg=fold_reg)
+        board_meta = load_cgra(cgra_arch, fold_reg=fold_reg)
     print(fold_reg)
     # Common routine
     board_name, board_meta = board_meta.popitem()
     print("INFO: Placing for", board_name)
     num_dim, raw_emb = parse_emb(netlist_embedding)
     board = make_board(board_meta)
-    board_info = board_meta[-1]
     place_on_board = generate_place_on_board(board_meta, fold_reg=fold_reg)
 
     fixed_blk_pos = {}
@@ -249,21 +440,30 @@ def main():
     for i in range(len(blks)):
         data_x[i] = emb[blks[i]]
 
-    centroids, cluster_cells, clusters = perform_global_placement(
-        blks, data_x, emb, fixed_blk_pos, netlists,
-        board_meta, fold_reg=fold_reg, num_clusters=num_of_kernels,
-        seed=seed, fpga_place=fpga_place, vis=vis_opt)
-
-    # placer with each cluster
-    board_pos = perform_detailed_placement(centroids,
-                                           cluster_cells, clusters,
-                                           fixed_blk_pos, netlists,
-                                           fold_reg, seed,
-                                           board_info,
-                                           aws_config)
-    # refinement
-    board_pos = refine_global_thunder(board_meta, board_pos, netlists,
-                                      fixed_blk_pos, fold_reg)
+    design = {"blks": blks, "data_x": data_x, "emb": emb,
+              "fixed_blk_pos": fixed_blk_pos, "netlists": netlists,
+              "board_meta": board_meta, "fold_reg": fold_reg,
+              "num_clusters": num_of_kernels, "fpga_place": fpga_place,
+              "aws_config": aws_config,
+              # seeds placed in parallel place their clusters one by one
+              "jobs": None if num_seeds == 1 else 1}
+    if num_seeds == 1:
+        print("Using seed", seed, "for placement")
+        board_pos = place_design(design, seed, vis=vis_opt)
+    else:
+        seeds = list(range(seed, seed + num_seeds))
+        print("Using seeds", seeds[0], "to", seeds[-1], "for placement")
+        results = place_seeds(design, seeds, jobs=args.jobs,
+                              score=args.score)
+        for result in results:
+            print("seed", str(result["seed"]) + ":", result["status"],
+                  args.score + ":", result["score"])
+        results = [result for result in results if result["status"] == "ok"]
+        if len(results) == 0:
+            raise Exception("Failed to place with any seed")
+        best = min(results, key=lambda x: x["score"])
+        print("Best seed:", best["seed"], args.score + ":", best["score"])
+        board_pos = best["board_pos"]
 
     for blk_id in board_pos:
         pos = board_pos[blk_id]
@@ -304,7 +504,7 @@ def perform_global_placement(blks, data_x, emb, fixed_blk_pos, netlists,
     # extra careful
     num_clusters = min(num_clusters, len(blks))
     print("Trying: num of clusters", num_clusters)
-    kmeans = KMeans(n_clusters=num_clusters, random_state=0).fit(data_x)
+    kmeans = KMeans(n_clusters=num_clusters, random_state=seed).fit(data_x)
     cluster_ids = kmeans.labels_
     clusters = {}
     for i in range(len(blks)):
@@ -360,30 +560,15 @@ def perform_global_placement(blks, data_x, emb, fixed_blk_pos, netlists,
     return centroids, cluster_cells, clusters
 
 
-def detailed_placement_thunder_wrapper(args):
-    clusters = {}
-    cells = {}
-    netlists = {}
-    fixed_blocks = {}
-    clb_type = args[0]["clb_type"]
-    fold_reg = args[0]["fold_reg"]
-    for i in range(len(args)):
-        arg = args[i]
-        clusters[i] = arg["clusters"]
-        cells[i] = arg["cells"]
-        netlists[i] = arg["new_netlist"]
-        fixed_blocks[i] = arg["blk_pos"]
-    return pythunder.detailed_placement(clusters, cells, netlists, fixed_blocks,
-                                        clb_type,
-                                        fold_reg)
-
-
 def perform_detailed_placement(centroids, cluster_cells, clusters,
                                fixed_blk_pos, netlists,
                                fold_reg, seed, board_info,
-                               aws_config=""):
-    from six.moves import queue
-    import boto3
+                               aws_config="", executor=None, jobs=None):
+    """detailed placement of every cluster with the executor. by default,
+       clusters are placed in local processes, or with AWS Lambda if
+       aws_config is set"""
+    from concurrent.futures import as_completed
+    import time
     board_pos = fixed_blk_pos.copy()
     map_args = []
 
@@ -398,10 +583,11 @@ def perform_detailed_placement(centroids, cluster_cells, clusters,
                       (margin + width, margin),
                       (margin + width, margin + height)]
 
+    reduced_netlists = reduce_cluster_graphs(netlists, clusters,
+                                             fixed_blk_pos)
     for c_id in cluster_cells:
         cells = cluster_cells[c_id]
-        new_netlist = reduce_cluster_graph(netlists, clusters,
-                                           fixed_blk_pos, c_id)
+        new_netlist = reduced_netlists[c_id]
         blk_pos = fixed_blk_pos.copy()
         for i in centroids:
             if i == c_id:
@@ -415,49 +601,19 @@ def perform_detailed_placement(centroids, cluster_cells, clusters,
                 "seed": seed, "clb_type": clb_type,
                 "disallowed_pos": disallowed_pos}
         map_args.append(args)
-    if not aws_config:
-        return detailed_placement_thunder_wrapper(map_args)
-    else:
-        # user need to specify a region in the environment
-        client = boto3.client("lambda")
-        import time
-        threads = []
-        lambda_arns = get_lambda_arn(map_args, aws_config)
-        que = queue.Queue()
-        lambda_res = {}
-        start = time.time()
-        for i in range(len(map_args)):
-            t = threading.Thread(target=lambda q, arg, arn:
-            q.put(client.invoke(
-                **{"FunctionName": arn,
-                   "InvocationType": "RequestResponse",
-                   "Payload":
-                       bytes(json.dumps(arg, cls=SetEncoder))})
-                  ["Payload"].read()),
-                                 args=(que, map_args[i], lambda_arns[i][1]))
-            threads.append(t)
-            lambda_res[i] = lambda_arns[i][0]
-        # sort the threads so that the ones needs most resources runs first
-        # this gives us some spaces for mis-calculated runtime approximation
-        index_list = list(range(len(map_args)))
-        index_list.sort(key=lambda x: lambda_res[x], reverse=True)
-        # start
-        for i in index_list:
-            t = threads[i]
-            t.start()
-        # skip join, use blocking while loop to aggressively waiting threads
-        # to finish
-        job_count = 0
-        # merge
-        while job_count < len(map_args):
-            if not que.empty():
-                res = json.loads(que.get())
-                r = res["body"]
-                board_pos.update(r)
-                job_count += 1
-        end = time.time()
-        print("Lambda takes", end - start, "seconds")
-        return board_pos
+    if executor is None:
+        if aws_config:
+            executor = LambdaExecutor(aws_config, jobs=jobs)
+        else:
+            executor = LocalExecutor(jobs)
+    start = time.time()
+    with executor:
+        futures = executor.place(map_args)
+        for future in as_completed(futures):
+            board_pos.update(future.result())
+    end = time.time()
+    print("Detailed placement takes", end - start, "seconds")
+    return board_pos
 
 
 if __name__ == "__main__":
@@ -1,30 +1,65 @@
 from __future__ import print_function, division
 from arch.cgra import parse_placement, save_routing_result
+from arch.cgra import load_routing_result
+from arch.route_file import save_binary_routing_result
+from arch.route_file import get_binary_routing_filename, path_to_entries
 from arch.netlist import group_reg_nets
 from arch.cgra_packer import load_packed_file
 from arch.cgra import determine_pin_ports
-from arch.cgra_route import parse_routing_resource, build_routing_resource
-from arch import parse_cgra
+from arch.cgra_route import RoutingResource, RoutingGraph
+from arch.cgra_route import encode_wire, decode_wire, get_wire_bus
+from arch.cgra_route import get_wire_io, get_wire_side, get_wire_track
+from arch.cgra_route import encode_path_wires, decode_path_wires
+from arch.cgra import read_netlist_json
+from arch.cgra_analytics import TIMING_INFO, is_timed_element
+from arch.cgra_analytics import get_blk_delay, compute_net_criticality
+from arch.cgra_analytics import compute_total_wire
+from arch import load_cgra, load_routing_resource
 import os
+import sys
+import shutil
+import csv
+import json
+import time
+import heapq
+import signal
+import multiprocessing
 import numpy as np
+from six.moves import cPickle as pickle
 from visualize import draw_board, draw_cell
 import matplotlib.pyplot as plt
-from util import deepcopy
 from tqdm import tqdm
 from argparse import ArgumentParser
 
 
 class Router:
     MAX_PATH_LENGTH = 10000
+    # negotiated congestion (PathFinder) parameters
+    NEGOTIATION_MAX_ITER = 30
+    PRESENT_FACTOR = 0.5
+    PRESENT_FACTOR_MULT = 1.5
+    HISTORY_FACTOR = 1.0
+    # how far a net's bounding box is expanded when partitioning nets
+    PARTITION_MARGIN = 2
+    # timing-driven routing parameters. criticality is capped so that
+    # critical nets still see some congestion cost
+    TIMING_UPDATE_INTERVAL = 20
+    MAX_CRITICALITY = 0.99
+    # connections at least this long are searched from both ends when
+    # bidirectional search is enabled
+    BIDIRECTIONAL_MIN_DIST = 6
+    # minimum number of seconds between two checkpoints
+    CHECKPOINT_INTERVAL = 60
 
     def __init__(self, cgra_filename,
                  board_meta, packed_filename, placement_filename,
                  use_tie_breaker=False, fold_reg=True, channel_width=None):
         self.board_meta = board_meta
         self.layout_board = board_meta[0]
-        netlists, _, id_to_name, _, track_mode = load_packed_file(
+        netlists, _, id_to_name, changed_pe, track_mode = load_packed_file(
             packed_filename, load_track_mode=True)
         self.id_to_name = id_to_name
+        self.changed_pe = changed_pe
         self.netlists = netlists
         self.track_mode = track_mode
 
@@ -42,12 +77,51 @@ class Router:
         # whether to fold registers when do routing
         self.fold_reg = fold_reg
 
+        # whether to grow multi-fanout nets from the whole routed tree
+        # instead of the closest position of it
+        self.steiner = False
+
+        # whether to search long connections from both the src and the sink.
+        # only works on the compiled routing graph
+        self.bidirectional = False
+
         # result
         self.route_result = {}
 
+        # negotiated congestion state, indexed by (pos, wire), where wire is
+        # a switch box out. only used by negotiated routing
+        self.wire_usage = None
+        self.history_cost = {}
+        self.present_factor = self.PRESENT_FACTOR
+
+        # timing-driven routing state. net_criticality is None unless
+        # enable_timing is called
+        self.blk_delay = {}
+        self.timed_blks = set()
+        self.net_criticality = None
+        self.critical_delay = 0
+        self.current_criticality = 0
+
+        # search statistics. search_stats holds the counters of the current
+        # channel trial and net_stats a record for every trial. both are
+        # only kept when collect_stats is set
+        self.collect_stats = False
+        self.search_stats = None
+        self.net_stats = []
+
+        # checkpointing. every removal committed to the routing resource is
+        # kept so that the routing resource can be restored along with
+        # route_result. checkpoint_file is None unless enable_checkpoint is
+        # called
+        self.checkpoint_file = None
+        self.committed_removals = []
+        self.last_checkpoint = 0
+
         print("Building routing resource")
-        r = parse_routing_resource(cgra_filename)
-        self.routing_resource = build_routing_resource(r)
+        self.cgra_filename = cgra_filename
+        self.routing_resource = RoutingResource(
+            load_routing_resource(cgra_filename))
+        self.routing_resource.build_wire_map()
 
         self.use_tie_breaker = use_tie_breaker
 
@@ -64,7 +138,7 @@ class Router:
             for pos in self.routing_resource:
                 chans = self.routing_resource[pos]["route_resource"]
                 for entry in chans:
-                    channel_set.add(entry[0][-1])
+                    channel_set.add(get_wire_track(entry[0]))
             self.channel_width = len(channel_set)
         print("Using", self.channel_width, "channels to route")
 
@@ -105,12 +179,10 @@ class Router:
 
         return direction
 
-    def heuristic_dist(self, depth, pos, dst, src=None):
-        if len(pos) == 3:
-            pos, _, _ = pos
+    def heuristic_dist(self, cost, pos, dst, src=None):
         x, y = pos
         dst_x, dst_y = dst
-        dist = abs(x - dst_x) + abs(y - dst_y) + depth[(x, y)]
+        dist = abs(x - dst_x) + abs(y - dst_y) + cost
         if self.use_tie_breaker:
             # http://theory.stanford.edu/~amitp/GameProgramming/Heuristics.html#breaking-ties
             assert (src is not None) and (len(src) == 2)
@@ -132,10 +204,18 @@ class Router:
                 raise Exception("Unexpected port " + port +
                                 " in reg folding mode at pos " + str(pos))
             port_chan = set()
-            for _, conn_out in route_resource_current_pos:
-                if conn_out[-1] == chan and conn_out[0] == bus:
-                    # as long as there is an out, we are good
-                    port_chan.add(conn_out)
+            if routing_resource.graph is not None:
+                graph = routing_resource.graph
+                for side in range(4):
+                    conn_out = encode_wire(bus, 1, side, chan)
+                    if graph.has_conn_out(pos, conn_out):
+                        port_chan.add(conn_out)
+            else:
+                for _, conn_out in route_resource_current_pos:
+                    if get_wire_track(conn_out) == chan and \
+                            get_wire_bus(conn_out) == bus:
+                        # as long as there is an out, we are good
+                        port_chan.add(conn_out)
         else:
             # normal ports
             port_chan = routing_resource[pos]["port"][port]
@@ -165,18 +245,22 @@ class Router:
                 routing_resource,
                 new_pos)
             # check if out is okay
-            dir_out = (bus, 1, out_direction, chan)
-            dir_in = (bus, 0, in_direction, chan)
+            dir_out = encode_wire(bus, 1, out_direction, chan)
+            dir_in = encode_wire(bus, 0, in_direction, chan)
             if is_io:
                 if dir_out in port_chan:
                     results.append((new_pos, dir_out, dir_in))
             else:
                 if dir_out in port_chan:
                     can_turn = False
-                    for conn_in, _ in route_resource_current_pos2:
-                        if conn_in == dir_in:
-                            can_turn = True
-                            break
+                    if routing_resource.graph is not None:
+                        can_turn = routing_resource.graph.has_conn_in(new_pos,
+                                                                      dir_in)
+                    else:
+                        for conn_in, _ in route_resource_current_pos2:
+                            if conn_in == dir_in:
+                                can_turn = True
+                                break
                     if can_turn:
                         results.append((new_pos, dir_out, dir_in))
         return results
@@ -237,6 +321,11 @@ class Router:
         if pos in working_set:
             working_set.remove(pos)
 
+        graph = routing_resource.graph
+        if graph is not None and not force_connect:
+            return self.get_graph_neighbors(graph, bus, chan, pos, track_in,
+                                            pin_pos, working_set)
+
         # # another override for mem tile jumping
         # # FIXME
         # if self.layout_board[pos[1]][pos[0]] == "m" and \
@@ -250,9 +339,9 @@ class Router:
                 routing_resource,
                 new_pos)
             # check if out is okay
-            dir_out = (bus, 1, out_direction, chan)
+            dir_out = encode_wire(bus, 1, out_direction, chan)
             in_direction = self.compute_direction(new_pos, pos)
-            dir_in = (bus, 0, in_direction, chan)
+            dir_in = encode_wire(bus, 0, in_direction, chan)
 
             # if self.layout_board[pos[1]][pos[0]] == "m" and \
             #         dir_out[2] == 1:
@@ -261,45 +350,86 @@ class Router:
                 if (track_in, dir_out) not in route_resource_current_pos:
                     # can't make the turn
                     continue
+            elif graph is not None:
+                if get_wire_side(dir_out) == get_wire_side(track_in) or \
+                        get_wire_bus(dir_out) != get_wire_bus(track_in) or \
+                        get_wire_track(dir_out) != \
+                        get_wire_track(track_in) or \
+                        not graph.has_conn_out(pos, dir_out):
+                    continue
             else:
                 dir_out_set = set()
                 for _, conn_out in route_resource_current_pos:
-                    if conn_out[-2] != track_in[-2] and \
-                            conn_out[0] == track_in[0] and \
-                            conn_out[-1] == track_in[-1]:
+                    if get_wire_side(conn_out) != get_wire_side(track_in) \
+                            and get_wire_bus(conn_out) == \
+                            get_wire_bus(track_in) and \
+                            get_wire_track(conn_out) == \
+                            get_wire_track(track_in):
                         dir_out_set.add(conn_out)
                 if dir_out not in dir_out_set:
                     continue
             can_turn = False
             if new_pos not in pin_pos:
-                for conn_in, _ in route_resource_current_pos2:
-                    if conn_in == dir_in:
-                        can_turn = True
-                        break
+                if graph is not None:
+                    can_turn = graph.has_conn_in(new_pos, dir_in)
+                else:
+                    for conn_in, _ in route_resource_current_pos2:
+                        if conn_in == dir_in:
+                            can_turn = True
+                            break
                 if can_turn:
                     results.append((new_pos, dir_out, dir_in))
             else:
                 results.append((new_pos, dir_out, dir_in))
         return results
 
+    def get_graph_neighbors(self, graph, bus, chan, pos, track_in, pin_pos,
+                            working_set):
+        """get_neighbors on the compiled routing graph, where the candidates
+           are the out wires track_in can still connect to"""
+        node = graph.get_node(pos, track_in)
+        if node < 0:
+            return []
+        candidates = {}
+        for out_node in graph.get_conn_out(node):
+            dir_out = graph.node_wires[out_node]
+            bus_out, io, side, track = decode_wire(dir_out)
+            if bus_out != bus or io != 1 or track != chan or \
+                    side not in graph.SIDE_OFFSET:
+                continue
+            dx, dy = graph.SIDE_OFFSET[side]
+            new_pos = (pos[0] + dx, pos[1] + dy)
+            if new_pos not in working_set:
+                continue
+            if new_pos not in pin_pos:
+                next_node = graph.next_node[out_node]
+                if next_node < 0 or graph.out_degree[next_node] == 0:
+                    continue
+            dir_in = encode_wire(bus, 0, (side + 2) % 4, chan)
+            candidates[new_pos] = (new_pos, dir_out, dir_in)
+        # same order as get_neighbors
+        return [candidates[new_pos] for new_pos in working_set
+                if new_pos in candidates]
+
     def is_pin_available(self, routing_resource,
                          pre_point, current_point, port, bus, chan,
                          is_self_connection=False):
         """returns True/False, [connection list + port]"""
-        if len(pre_point) == 2:
+        if isinstance(pre_point, tuple):
             direction = self.compute_direction(current_point, pre_point)
             # test if we have direct connection to the operand
             # that is, in -> op
-            dir_in = (bus, 0, direction, chan)
+            dir_in = encode_wire(bus, 0, direction, chan)
         else:
-            assert len(pre_point) == 4
+            # track in
+            assert isinstance(pre_point, int)
             dir_in = pre_point
         route_resource = routing_resource[current_point]["route_resource"]
         sink_resource = routing_resource[current_point]["port"]
         if port not in sink_resource:
             assert(self.fold_reg and port == "reg")
             for i in range(4):
-                dir_out = (bus, 1, i, chan)
+                dir_out = encode_wire(bus, 1, i, chan)
                 if (dir_in, dir_out) in route_resource:
                     return True, [dir_in, current_point, port]
             return False, None
@@ -307,11 +437,17 @@ class Router:
             operand_channels = sink_resource[port]
 
             operand_channels = [entry for entry in operand_channels
-                                if entry[-1] == chan]
-
-            route_resource = [entry for entry in route_resource
-                              if entry[-1][-1] == chan and
-                              entry[-1][0] == bus]
+                                if get_wire_track(entry) == chan]
+            if self.wire_usage is not None:
+                # prefer less congested wires
+                operand_channels.sort(
+                    key=lambda conn: self.get_link_cost(current_point, conn))
+
+            graph = routing_resource.graph
+            if graph is None:
+                route_resource = [entry for entry in route_resource
+                                  if get_wire_track(entry[-1]) == chan and
+                                  get_wire_bus(entry[-1]) == bus]
 
             # if self.layout_board[current_point[1]][current_point[0]]
             #  == "m" and \
@@ -326,6 +462,11 @@ class Router:
             #          out_sxtx -> op
             for conn in operand_channels:
                 # the format in operand_channels is out -> in
+                if graph is not None:
+                    if get_wire_bus(conn) == bus and \
+                            graph.has_conn(current_point, dir_in, conn):
+                        return True, [dir_in, conn, current_point, port]
+                    continue
                 conn_chan = (dir_in, conn)
                 if conn_chan in route_resource:
                     return True, [dir_in, conn, current_point, port]
@@ -334,16 +475,11 @@ class Router:
                 # routing resource, it won't be able to handle that
                 # brute forcing to see if we can make the connection
                 for i in range(4):
-                    dir_out = (bus, 1, i, chan)
+                    dir_out = encode_wire(bus, 1, i, chan)
                     if dir_out in operand_channels:
                         return True, [dir_in, dir_out, current_point, port]
             return False, None
 
-    @staticmethod
-    def copy_resource(routing_resource):
-        res = deepcopy(routing_resource)
-        return res
-
     @staticmethod
     def sort_netlist_id_for_io(netlist, reg_nets):
         netlist_ids = list(netlist.keys())
@@ -367,24 +503,28 @@ class Router:
             path_entry = path[i]
             if len(path_entry) == 2:
                 if path_entry[1][0] == pos:
-                    assert path_entry[1][1][1] == 0
+                    assert get_wire_io(path_entry[1][1]) == 0
                     return path_entry[1][1]
             elif len(path_entry) == 3:
                 if path_entry[1] == pos:
-                    assert path_entry[0][1] == 0
+                    assert get_wire_io(path_entry[0]) == 0
                     return path_entry[0]
             elif len(path_entry) == 4:
                 if path_entry[2] == pos:
-                    assert path_entry[0][1] == 0
+                    assert get_wire_io(path_entry[0]) == 0
                     return path_entry[0]
         # Keyi:
         # it may happen when the pos directly comes from src
-        if len(path) >= 2 and len(path[1]) == 2 and path[1][0][0] == pos:
-            assert Router.manhattan_dist(path[0][0][0], pos) == 1
-            direction = path[0][0][3]
-            assert direction[1] == 0
-            return direction
-        raise Exception("Unable to find pre pos for pos " + str(pos))
+        # going forwards to see if any src connects to it
+        for i in range(len(path) - 1):
+            if len(path[i]) == 1 and len(path[i + 1]) == 2 and \
+                    path[i + 1][0][0] == pos:
+                assert Router.manhattan_dist(path[i][0][0], pos) == 1
+                direction = path[i][0][3]
+                assert get_wire_io(direction) == 0
+                return direction
+        # the net never comes into pos, e.g. pos is the src itself
+        return None
 
     @staticmethod
     def sort_net(net, placement):
@@ -406,118 +546,859 @@ class Router:
             pos_set.add(pos)
         else:
             port_operands = route_resource[pos]["port"][port]
-            port_operands = [x for x in port_operands if x[0] == bus
-                             and x[-1] == chan]
+            port_operands = [x for x in port_operands
+                             if get_wire_bus(x) == bus and
+                             get_wire_track(x) == chan]
             for conn in port_operands:
                 pos_set.add((pos, conn))
 
     @staticmethod
-    def allow_chan(pos, pos_set):
-        if pos in pos_set:
-            pos_set.remove(pos)
-        entry_to_remove = set()
-        for entry in pos_set:
-            if len(entry) == 2 and not isinstance(entry[-1], int):
-                assert (isinstance(entry[1], tuple))
-                entry_pos = entry[0]
-                if pos == entry_pos:
-                    entry_to_remove.add(entry)
-        for entry in entry_to_remove:
-            pos_set.remove(entry)
-
-    def route(self):
+    def allow_chan(pos, port, bus, chan, route_resource, pos_set):
+        # only undo dis_allow_chan for the port. the other ports of the tile
+        # may still be waiting for a net, e.g. a reg net of this one
+        if port == "reg":
+            pos_set.discard(pos)
+        else:
+            port_operands = route_resource[pos]["port"][port]
+            for conn in port_operands:
+                if get_wire_bus(conn) == bus and \
+                        get_wire_track(conn) == chan:
+                    pos_set.discard((pos, conn))
+
+    def route(self, jobs=1, partition=False):
         print("INFO: Performing MST/A* routing")
+        linked_nets, reg_nets, reg_net_order = self.group_reg_nets()
+        net_list_ids = self.sort_netlist_id_for_io(self.netlists, reg_nets)
+        # nets restored from a checkpoint are already routed
+        net_list_ids = [net_id for net_id in net_list_ids
+                        if net_id not in reg_nets and
+                        net_id not in self.route_result]
+        self.route_nets(net_list_ids, linked_nets, reg_net_order, jobs=jobs,
+                        partition=partition)
+
+    def route_incremental(self, prev_route_result, prev_placement, jobs=1,
+                          partition=False):
+        """ECO routing. keeps the previous paths of the nets whose blocks
+           didn't move and re-routes the rest. if that fails, the kept nets
+           around the failed ones are ripped up and re-routed as well.
+           prev_route_result is the one returned by load_routing_result"""
+        print("INFO: Performing incremental MST/A* routing")
+        prev_route_result = dict((net_id, encode_path_wires(path))
+                                 for net_id, path in prev_route_result.items())
+        linked_nets, reg_nets, reg_net_order = self.group_reg_nets()
+        net_list_ids = self.sort_netlist_id_for_io(self.netlists, reg_nets)
+        net_list_ids = [net_id for net_id in net_list_ids
+                        if net_id not in reg_nets]
+        kept_wires = {}
+        used_wires = set()
+        for net_id in net_list_ids:
+            # reg nets are routed along with the main net
+            net_ids = [net_id] + list(linked_nets.get(net_id, []))
+            if self.is_net_dirty(net_ids, prev_route_result, prev_placement):
+                continue
+            wires = set()
+            for n_id in net_ids:
+                wires.update(self.get_path_wires(prev_route_result[n_id]))
+            if not wires.isdisjoint(used_wires):
+                continue
+            used_wires.update(wires)
+            kept_wires[net_id] = wires
+
+        while True:
+            dirty_nets = [net_id for net_id in net_list_ids
+                          if net_id not in kept_wires]
+            for net_id in net_list_ids:
+                if net_id not in kept_wires:
+                    continue
+                for n_id in [net_id] + list(linked_nets.get(net_id, [])):
+                    path = prev_route_result[n_id]
+                    self.route_result[n_id] = path
+                    self.update_routing_resource(self.routing_resource, path)
+            self.routing_resource.commit()
+            print("Keeping", len(kept_wires), "nets,",
+                  "re-routing", len(dirty_nets), "nets")
+            try:
+                self.route_nets(dirty_nets, linked_nets, reg_net_order,
+                                jobs=jobs, partition=partition)
+                return
+            except Exception:
+                # the net that failed and the ones not routed yet
+                unrouted_nets = [net_id for net_id in dirty_nets
+                                 if net_id not in self.route_result]
+                if len(kept_wires) == 0 or len(unrouted_nets) == 0:
+                    raise
+            # the kept paths may wall them in. rip up the ones in their
+            # bounding boxes, or every kept net if there is none, and route
+            # again from scratch
+            ripped_nets = set()
+            for net_id in unrouted_nets:
+                x_min, y_min, x_max, y_max = self.get_net_bbox(net_id,
+                                                               linked_nets)
+                for kept_net_id, wires in kept_wires.items():
+                    for (x, y), _ in wires:
+                        if x_min <= x <= x_max and y_min <= y <= y_max:
+                            ripped_nets.add(kept_net_id)
+                            break
+            if len(ripped_nets) == 0:
+                ripped_nets = set(kept_wires)
+            print("Failed to route", len(unrouted_nets), "nets,",
+                  "ripping up", len(ripped_nets), "kept nets")
+            for net_id in ripped_nets:
+                kept_wires.pop(net_id)
+            self.reset_routing_resource()
+
+    def get_route_result(self):
+        """route_result with the wires as tuples, which is the format used
+           by save_routing_result"""
+        return dict((net_id, decode_path_wires(path))
+                    for net_id, path in self.route_result.items())
+
+    def is_net_dirty(self, net_ids, prev_route_result, prev_placement):
+        for net_id in net_ids:
+            if net_id not in prev_route_result:
+                return True
+            for blk_id, _ in self.netlists[net_id]:
+                if prev_placement.get(blk_id) != self.placement[blk_id]:
+                    return True
+            # the net itself may have changed, e.g. a sink is added
+            pins = set([(self.placement[blk_id], port)
+                        for blk_id, port in self.netlists[net_id]])
+            if self.get_path_pins(prev_route_result[net_id]) != pins:
+                return True
+        return False
+
+    def reset_routing_resource(self):
+        """start over with nothing routed"""
+        compiled = self.routing_resource.graph is not None
+        self.routing_resource = RoutingResource(
+            load_routing_resource(self.cgra_filename))
+        self.routing_resource.build_wire_map()
+        if compiled:
+            self.routing_resource.compile()
+        self.route_result = {}
+
+    def route_nets(self, net_list_ids, linked_nets, reg_net_order, jobs=1,
+                   partition=False):
+        if self.net_criticality is not None:
+            self.update_criticality()
+            net_list_ids = self.sort_by_criticality(net_list_ids)
+        workers = []
+        if jobs > 1:
+            workers = self.start_route_workers(jobs, linked_nets,
+                                               reg_net_order)
+        # removals committed since the workers last caught up
+        removals = []
+        try:
+            if partition:
+                batches = self.partition_nets(net_list_ids, linked_nets)
+                print("Routing", len(net_list_ids), "nets in", len(batches),
+                      "batches")
+                for batch in tqdm(batches):
+                    removals = self.route_batch(batch, linked_nets,
+                                                reg_net_order, workers,
+                                                removals)
+                return
+            remaining_nets = list(net_list_ids)
+            for i in tqdm(range(len(net_list_ids))):
+                if self.net_criticality is not None and i > 0 and \
+                        i % self.TIMING_UPDATE_INTERVAL == 0:
+                    # slack changes as nets get routed
+                    self.update_criticality()
+                    remaining_nets = self.sort_by_criticality(remaining_nets)
+                net_id = remaining_nets.pop(0)
+                if workers:
+                    result = self.route_net_channels_parallel(workers,
+                                                              net_id,
+                                                              removals)
+                else:
+                    result = self.route_net_channels(net_id, linked_nets,
+                                                     reg_net_order,
+                                                     self.routing_resource)
+                _, removals = self.commit_net(net_id, linked_nets, result)
+        except BaseException:
+            # keep what has been routed so far, e.g. when a net fails to
+            # route or the job is interrupted
+            if self.checkpoint_file is not None:
+                self.save_checkpoint()
+            raise
+        finally:
+            self.stop_route_workers(workers)
+
+    def commit_net(self, net_id, linked_nets, result):
+        """commit the best channel of the result of route_net_channels.
+           returns the channel and its removals"""
+        route_path, route_length, chan_removals, reg_route_path, chan_stats = \
+            result
+        # find the minimum route path
+        min_chan = self.find_min_chan(route_length)
+        if route_length[min_chan] >= self.MAX_PATH_LENGTH:
+            raise Exception("Failed to route for net " + net_id)
+
+        # update the actual routing resource
+        # self-loop is fixed up
+        removals = chan_removals[min_chan]
+        self.routing_resource.replay(removals)
+        self.routing_resource.commit()
+        if self.checkpoint_file is not None:
+            self.committed_removals += removals
+
+        # add the final path to the design. it's done last so that a
+        # checkpoint saved in between never has the net without its
+        # removals, or the stats of a net that is routed again on resume
+        self.route_result[net_id] = route_path[min_chan]
+        if net_id in linked_nets:
+            reg_path = reg_route_path[min_chan]
+            for reg_net_id in reg_path:
+                self.route_result[reg_net_id] = reg_path[reg_net_id]
+        self.add_net_stats(net_id, chan_stats, min_chan)
+        if self.checkpoint_file is not None and \
+                time.time() - self.last_checkpoint >= \
+                self.CHECKPOINT_INTERVAL:
+            self.save_checkpoint()
+        return min_chan, removals
+
+    def enable_checkpoint(self, checkpoint_file):
+        """periodically save the routing progress to checkpoint_file while
+           routing with route"""
+        self.checkpoint_file = checkpoint_file
+        self.last_checkpoint = time.time()
+
+    def save_checkpoint(self):
+        """write route_result and the removals committed to the routing
+           resource so far"""
+        state = {"placement": self.placement,
+                 "route_result": self.route_result,
+                 "removals": self.committed_removals,
+                 "net_stats": self.net_stats}
+        # write to a temp file first so that an interrupted write won't
+        # corrupt the previous checkpoint
+        tmp_filename = self.checkpoint_file + "." + str(os.getpid())
+        with open(tmp_filename, "wb") as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_filename, self.checkpoint_file)
+        self.last_checkpoint = time.time()
+
+    def load_checkpoint(self, checkpoint_file):
+        """restore the routing progress saved by save_checkpoint. it has to
+           be called before anything is routed"""
+        if self.route_result or self.routing_resource.journal:
+            raise Exception("Cannot resume after routing has started")
+        with open(checkpoint_file, "rb") as f:
+            state = pickle.load(f)
+        if state["placement"] != self.placement or \
+                not set(state["route_result"]).issubset(self.netlists):
+            raise Exception("Checkpoint " + checkpoint_file + " does not " +
+                            "match the design")
+        self.routing_resource.replay(state["removals"])
+        self.routing_resource.commit()
+        self.committed_removals = list(state["removals"])
+        self.route_result = state["route_result"]
+        self.net_stats = state["net_stats"]
+        print("Resuming with", len(self.route_result), "routed nets")
+
+    def get_net_bbox(self, net_id, linked_nets):
+        """bounding box of the net and its linked reg nets, expanded by
+           PARTITION_MARGIN"""
+        xs = []
+        ys = []
+        for n_id in [net_id] + list(linked_nets.get(net_id, [])):
+            for blk_id, _ in self.netlists[n_id]:
+                x, y = self.placement[blk_id]
+                xs.append(x)
+                ys.append(y)
+        margin = self.PARTITION_MARGIN
+        return min(xs) - margin, min(ys) - margin, max(xs) + margin, \
+            max(ys) + margin
+
+    @staticmethod
+    def bbox_intersect(bbox1, bbox2):
+        return bbox1[0] <= bbox2[2] and bbox2[0] <= bbox1[2] and \
+            bbox1[1] <= bbox2[3] and bbox2[1] <= bbox1[3]
+
+    def partition_nets(self, net_list_ids, linked_nets):
+        """group nets into batches whose nets have non-intersecting bounding
+           boxes. a net is put right after the last batch that has a net
+           intersecting with it, so these nets are still routed in order"""
+        batches = []
+        batch_bboxes = []
+        for net_id in net_list_ids:
+            bbox = self.get_net_bbox(net_id, linked_nets)
+            index = 0
+            for i in range(len(batches) - 1, -1, -1):
+                if any(self.bbox_intersect(bbox, b) for b in batch_bboxes[i]):
+                    index = i + 1
+                    break
+            if index == len(batches):
+                batches.append([])
+                batch_bboxes.append([])
+            batches[index].append(net_id)
+            batch_bboxes[index].append(bbox)
+        return batches
+
+    def get_result_wires(self, result, chan):
+        route_path, _, _, reg_route_path, _ = result
+        paths = [route_path[chan]]
+        if chan in reg_route_path:
+            paths += list(reg_route_path[chan].values())
+        wires = set()
+        for path in paths:
+            wires.update(self.get_path_wires(path))
+        return wires
+
+    def route_batch(self, batch, linked_nets, reg_net_order, workers,
+                    removals):
+        """route every net in the batch against the same routing resource
+           and commit them in order. a net whose wires conflict with the
+           ones committed before it is routed again. returns the removals
+           the workers haven't caught up on"""
+        if workers and len(batch) == 1:
+            results = [self.route_net_channels_parallel(workers, batch[0],
+                                                        removals)]
+            removals = []
+        elif workers:
+            results = self.route_nets_parallel(workers, batch, removals)
+            removals = []
+        else:
+            results = [self.route_net_channels(net_id, linked_nets,
+                                               reg_net_order,
+                                               self.routing_resource)
+                       for net_id in batch]
+        used_wires = set()
+        for net_id, result in zip(batch, results):
+            chan = self.find_min_chan(result[1])
+            if used_wires:
+                wires = self.get_result_wires(result, chan)
+                if not wires.isdisjoint(used_wires):
+                    # fall back to the serial one
+                    result = self.route_net_channels(net_id, linked_nets,
+                                                     reg_net_order,
+                                                     self.routing_resource)
+            chan, net_removals = self.commit_net(net_id, linked_nets, result)
+            used_wires.update(self.get_result_wires(result, chan))
+            removals += net_removals
+        return removals
+
+    def start_route_workers(self, jobs, linked_nets, reg_net_order):
+        """fork workers that route channel or net trials. the routing
+           resource is inherited through fork instead of being pickled for
+           every net"""
+        workers = []
+        for _ in range(jobs):
+            conn, child_conn = multiprocessing.Pipe()
+            p = multiprocessing.Process(target=route_worker,
+                                        args=(self, child_conn, linked_nets,
+                                              reg_net_order))
+            p.daemon = True
+            p.start()
+            child_conn.close()
+            workers.append((p, conn))
+        return workers
+
+    @staticmethod
+    def stop_route_workers(workers):
+        for p, conn in workers:
+            try:
+                conn.send(None)
+            except (IOError, OSError):
+                pass
+            conn.close()
+        for p, _ in workers:
+            p.join()
+
+    @staticmethod
+    def run_route_workers(workers, tasks, removals):
+        """send the tasks, i.e. a list of (net_id, chans) for each worker,
+           along with the removals to catch up on. returns the results of
+           each worker"""
+        for (_, conn), worker_tasks in zip(workers, tasks):
+            conn.send((removals, worker_tasks))
+        worker_results = []
+        for _, conn in workers:
+            results = conn.recv()
+            if isinstance(results, Exception):
+                raise results
+            worker_results.append(results)
+        return worker_results
+
+    def route_net_channels_parallel(self, workers, net_id, removals):
+        """same as route_net_channels, but the channels are routed by the
+           workers. results are merged by channel so the winner is the same
+           as the sequential one"""
+        num_workers = min(len(workers), self.channel_width)
+        tasks = []
+        for i in range(len(workers)):
+            if i < num_workers:
+                chans = list(range(i, self.channel_width, num_workers))
+                tasks.append([(net_id, chans)])
+            else:
+                tasks.append([])
+        results = ({}, {}, {}, {}, {})
+        for worker_results in self.run_route_workers(workers, tasks,
+                                                     removals):
+            for result in worker_results:
+                for entry, worker_entry in zip(results, result):
+                    entry.update(worker_entry)
+        return results
+
+    def route_nets_parallel(self, workers, net_ids, removals):
+        """route_net_channels for each net, spread over the workers"""
+        tasks = [[] for _ in workers]
+        for i, net_id in enumerate(net_ids):
+            tasks[i % len(workers)].append((net_id, None))
+        worker_results = self.run_route_workers(workers, tasks, removals)
+        results = []
+        for i in range(len(net_ids)):
+            results.append(worker_results[i % len(workers)][
+                i // len(workers)])
+        return results
+
+    def group_reg_nets(self):
         if self.fold_reg:
-            linked_nets, reg_nets, reg_net_order = group_reg_nets(self.netlists)
+            return group_reg_nets(self.netlists)
         else:
-            linked_nets = {}
-            reg_nets = set()
-            reg_net_order = {}
-        net_list_ids = self.sort_netlist_id_for_io(self.netlists, reg_nets)
-        for net_id in tqdm(net_list_ids):
-            if net_id in reg_nets:
+            return {}, set(), {}
+
+    def find_min_chan(self, route_length):
+        min_chan = 0
+        for i in range(1, self.channel_width):
+            if route_length[i] < route_length[min_chan]:
+                min_chan = i
+        return min_chan
+
+    def route_net_channels(self, net_id, linked_nets, reg_net_order,
+                           routing_resource, chans=None):
+        """route the net as well as its linked reg nets on every channel.
+           each channel is a trial on the routing resource that gets rolled
+           back afterwards. returns route path, route length, routing resource
+           removals, reg route path and search statistics, all indexed by
+           channel.
+           unless we are negotiating congestion, channels that can't beat
+           the shortest one so far are pruned, which doesn't change the
+           channel picked by find_min_chan"""
+        net = self.netlists[net_id]
+        assert (len(net) > 1)
+        bus = self.track_mode[net_id]
+        # avoid going back
+        net = self.sort_net(net, self.placement)
+
+        route_path = {}
+        route_length = {}
+        chan_removals = {}
+        reg_route_path = {}
+        chan_stats = {}
+        # branch and bound. find_min_chan picks the first of the shortest
+        # channels, so a later channel has to be strictly shorter
+        min_length = None
+        lower_bound = self.get_net_lower_bound(net)
+        if chans is None:
+            chans = range(self.channel_width)
+        for chan in chans:
+            # FIXME: force to use channel one
+            # need to fix it after IO is re-worked
+            if net[0][0][0] == "i":
+                if chan != 0:
+                    route_length[chan] = self.MAX_PATH_LENGTH
+                    continue
+            if min_length is not None and min_length <= lower_bound:
+                # nothing can be shorter
+                route_length[chan] = self.MAX_PATH_LENGTH
+                if self.collect_stats:
+                    self.start_search_stats()
+                    self.search_stats["outcome"] = "pruned"
+                    chan_stats[chan] = \
+                        self.finish_search_stats(self.MAX_PATH_LENGTH)
                 continue
-            net = self.netlists[net_id]
-            assert (len(net) > 1)
-            bus = self.track_mode[net_id]
-            # avoid going back
-            net = self.sort_net(net, self.placement)
-
-            route_path = {}
-            route_length = {}
-            chan_resources = {}
-            reg_route_path = {}
-            for chan in range(self.channel_width):
-                # FIXME: force to use channel one
-                # need to fix it after IO is re-worked
-                if net[0][0][0] == "i":
-                    if chan != 0:
+            if self.collect_stats:
+                self.start_search_stats()
+            # make sure that it won't route on top of reg net
+            if net_id in linked_nets:
+                pos_set = set()
+                for reg_net_id in linked_nets[net_id]:
+                    reg_net = self.netlists[reg_net_id]
+                    for blk_id, port in reg_net:
+                        pos = self.placement[blk_id]
+                        self.dis_allow_chan(pos, port, bus, chan,
+                                            routing_resource,
+                                            pos_set)
+            else:
+                pos_set = None
+
+            checkpoint = routing_resource.checkpoint()
+            path_len, final_path, _ = \
+                self.route_net(bus, chan, net,
+                               routing_resource,
+                               pos_set=pos_set,
+                               max_length=min_length)
+            route_path[chan] = final_path
+            route_length[chan] = path_len
+            if path_len >= self.MAX_PATH_LENGTH:
+                self.rollback_trial(routing_resource, checkpoint)
+                if self.collect_stats:
+                    chan_stats[chan] = self.finish_search_stats(path_len)
+                continue    # don't even bother
+            if net_id in linked_nets:
+                if chan not in reg_route_path:
+                    reg_route_path[chan] = {}
+                reg_route_path[chan][net_id] = final_path
+                for reg_net_id in linked_nets[net_id]:
+                    parent_net_id = reg_net_order[reg_net_id]
+                    reg_path = reg_route_path[chan][parent_net_id]
+                    reg_net = self.netlists[reg_net_id]
+                    # because routing resource has been updated, we don't
+                    # need to keep track of old ones
+                    # pos_set = set()
+                    reg_length, reg_path, _ = \
+                        self.route_reg_net(reg_net, bus, chan,
+                                           routing_resource,
+                                           reg_path,
+                                           pos_set)
+                    route_length[chan] += reg_length
+                    if route_length[chan] >= self.MAX_PATH_LENGTH:
+                        break   # just terminate without proceeding next
+                    if min_length is not None and \
+                            route_length[chan] >= min_length:
                         route_length[chan] = self.MAX_PATH_LENGTH
+                        if self.search_stats is not None:
+                            self.search_stats["outcome"] = "pruned"
+                        break
+                    reg_route_path[chan][reg_net_id] = reg_path
+            chan_removals[chan] = self.rollback_trial(routing_resource,
+                                                      checkpoint)
+            if self.wire_usage is None and \
+                    route_length[chan] < self.MAX_PATH_LENGTH:
+                # route length is only final without congestion cost
+                min_length = route_length[chan]
+            if self.collect_stats:
+                chan_stats[chan] = \
+                    self.finish_search_stats(route_length[chan])
+        return route_path, route_length, chan_removals, reg_route_path, \
+            chan_stats
+
+    def rollback_trial(self, routing_resource, checkpoint):
+        """undo a channel trial. this is where the routing resource used to
+           be copied, so it's timed as well"""
+        if self.search_stats is None:
+            return routing_resource.rollback(checkpoint)
+        start = time.time()
+        removals = routing_resource.rollback(checkpoint)
+        self.search_stats["rollback_time"] += time.time() - start
+        return removals
+
+    def start_search_stats(self):
+        # every expansion queries the neighbors once, either through
+        # get_neighbors/get_port_neighbors or the reverse adjacency of the
+        # routing graph, so nodes_expanded also counts the neighbor calls
+        self.search_stats = {"nodes_expanded": 0, "pin_checks": 0,
+                             "rollback_time": 0.0,
+                             "wall_time": time.time()}
+
+    def finish_search_stats(self, route_length):
+        stats = self.search_stats
+        self.search_stats = None
+        stats["wall_time"] = time.time() - stats["wall_time"]
+        if route_length >= self.MAX_PATH_LENGTH:
+            stats.setdefault("outcome", "failed")
+            stats["route_length"] = None
+        else:
+            stats["outcome"] = "routed"
+            stats["route_length"] = route_length
+        return stats
+
+    def add_net_stats(self, net_id, chan_stats, min_chan, iteration=None):
+        """record the channel trials of the net"""
+        for chan in sorted(chan_stats):
+            stats = {"net": net_id, "chan": chan,
+                     "committed": chan == min_chan}
+            if iteration is not None:
+                stats["iteration"] = iteration
+            stats.update(chan_stats[chan])
+            self.net_stats.append(stats)
+
+    def save_stats(self, route_file):
+        """write the search statistics next to the routing result, as
+           design.stats.json and design.stats.csv"""
+        filename, _ = os.path.splitext(route_file)
+        with open(filename + ".stats.json", "w") as f:
+            json.dump(self.net_stats, f, indent=2, sort_keys=True)
+        fields = ["net", "chan", "iteration", "outcome", "committed",
+                  "route_length", "nodes_expanded", "pin_checks",
+                  "rollback_time", "wall_time"]
+        with open(filename + ".stats.csv", "w") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for stats in self.net_stats:
+                writer.writerow(stats)
+
+    def route_negotiated(self):
+        """negotiated congestion routing (PathFinder). every net is first
+           routed on the full routing resource, allowing switch box wires to
+           be shared. nets that use over-used wires are ripped up and
+           re-routed with present and history congestion cost until no wire
+           is shared"""
+        print("INFO: Performing negotiated congestion routing")
+        linked_nets, reg_nets, reg_net_order = self.group_reg_nets()
+        net_list_ids = self.sort_netlist_id_for_io(self.netlists, reg_nets)
+        net_list_ids = [net_id for net_id in net_list_ids
+                        if net_id not in reg_nets]
+
+        self.route_result = {}
+        self.wire_usage = {}
+        self.history_cost = {}
+        self.present_factor = self.PRESENT_FACTOR
+        if self.net_criticality is not None:
+            self.update_criticality()
+            net_list_ids = self.sort_by_criticality(net_list_ids)
+        net_wires = {}
+        net_paths = {}
+        # nets that can't be routed even when sharing wires
+        unroutable_nets = []
+        ripped_nets = net_list_ids
+        converged = False
+        for iteration in range(self.NEGOTIATION_MAX_ITER):
+            for net_id in tqdm(ripped_nets):
+                # rip up
+                for wire in net_wires.pop(net_id, set()):
+                    self.wire_usage[wire].remove(net_id)
+
+                if self.net_criticality is not None:
+                    self.current_criticality = min(
+                        self.net_criticality.get(net_id, 0),
+                        self.MAX_CRITICALITY)
+                route_path, route_length, _, reg_route_path, chan_stats = \
+                    self.route_net_channels(net_id, linked_nets,
+                                            reg_net_order,
+                                            self.routing_resource)
+                # congestion cost can go beyond MAX_PATH_LENGTH, so only
+                # routable channels are compared
+                route_cost = {}
+                for chan in route_length:
+                    if route_length[chan] >= self.MAX_PATH_LENGTH:
                         continue
-                # make sure that it won't route on top of reg net
+                    elif net_id in linked_nets:
+                        route_cost[chan] = self.compute_route_cost(
+                            route_length[chan],
+                            reg_route_path[chan].values())
+                    else:
+                        route_cost[chan] = self.compute_route_cost(
+                            route_length[chan], [route_path[chan]])
+                if len(route_cost) == 0:
+                    # congestion has nothing to do with it, so it won't
+                    # route in later iterations either. keep negotiating the
+                    # rest to report every such net at once
+                    self.add_net_stats(net_id, chan_stats, None,
+                                       iteration=iteration)
+                    unroutable_nets.append(net_id)
+                    continue
+                min_chan = min(route_cost,
+                               key=lambda c: (route_cost[c], c))
+                self.add_net_stats(net_id, chan_stats, min_chan,
+                                   iteration=iteration)
+
                 if net_id in linked_nets:
-                    pos_set = set()
-                    for reg_net_id in linked_nets[net_id]:
-                        reg_net = self.netlists[reg_net_id]
-                        for blk_id, port in reg_net:
-                            pos = self.placement[blk_id]
-                            self.dis_allow_chan(pos, port, bus, chan,
-                                                self.routing_resource,
-                                                pos_set)
+                    paths = reg_route_path[min_chan]
                 else:
-                    pos_set = None
-
-                path_len, final_path, routing_resource = \
-                    self.route_net(bus, chan, net,
-                                   self.routing_resource,
-                                   pos_set=pos_set)
-                chan_resources[chan] = routing_resource
-                route_path[chan] = final_path
-                route_length[chan] = path_len
-                if path_len >= self.MAX_PATH_LENGTH:
-                    continue    # don't even bother
-                if net_id in linked_nets:
-                    if chan not in reg_route_path:
-                        reg_route_path[chan] = {}
-                    reg_route_path[chan][net_id] = final_path
-                    for reg_net_id in linked_nets[net_id]:
-                        parent_net_id = reg_net_order[reg_net_id]
-                        reg_path = reg_route_path[chan][parent_net_id]
-                        reg_net = self.netlists[reg_net_id]
-                        # because routing resource has been updated, we don't
-                        # need to keep track of old ones
-                        # pos_set = set()
-                        reg_length, reg_path, routing_resource = \
-                            self.route_reg_net(reg_net, bus, chan,
-                                               routing_resource,
-                                               reg_path,
-                                               pos_set)
-                        route_length[chan] += reg_length
-                        if route_length[chan] >= self.MAX_PATH_LENGTH:
-                            break   # just terminate without proceeding next
-                        reg_route_path[chan][reg_net_id] = reg_path
-                        chan_resources[chan] = routing_resource
-
-            # find the minimum route path
-            min_chan = 0
-            for i in range(1, self.channel_width):
-                if route_length[i] < route_length[min_chan]:
-                    min_chan = i
-            if route_length[min_chan] >= self.MAX_PATH_LENGTH:
-                raise Exception("Failed to route for net " + net_id)
-            # add the final path to the design
-            self.route_result[net_id] = route_path[min_chan]
-            if net_id in linked_nets:
-                reg_path = reg_route_path[min_chan]
-                for reg_net_id in reg_path:
-                    self.route_result[reg_net_id] = reg_path[reg_net_id]
+                    paths = {net_id: route_path[min_chan]}
+                net_paths[net_id] = paths
+                wires = set()
+                for path in paths.values():
+                    wires.update(self.get_path_wires(path))
+                for wire in wires:
+                    if wire not in self.wire_usage:
+                        self.wire_usage[wire] = set()
+                    self.wire_usage[wire].add(net_id)
+                net_wires[net_id] = wires
+            self.current_criticality = 0
+
+            overused_wires = [wire for wire in self.wire_usage
+                              if len(self.wire_usage[wire]) > 1]
+            print("Iteration", iteration, "over-used wires:",
+                  len(overused_wires))
+            if len(overused_wires) == 0:
+                converged = True
+                break
+            # update the history cost and rip up every net that shares wires
+            congested_nets = set()
+            for wire in overused_wires:
+                usage = self.wire_usage[wire]
+                self.history_cost[wire] = self.history_cost.get(wire, 0) + \
+                    self.HISTORY_FACTOR * (len(usage) - 1)
+                congested_nets.update(usage)
+            self.present_factor *= self.PRESENT_FACTOR_MULT
+            if self.net_criticality is not None:
+                route_result = {}
+                for paths in net_paths.values():
+                    route_result.update(paths)
+                self.update_criticality(route_result)
+                net_list_ids = self.sort_by_criticality(net_list_ids)
+            ripped_nets = [net_id for net_id in net_list_ids
+                           if net_id in congested_nets]
+
+        self.wire_usage = None
+        if len(unroutable_nets) > 0:
+            raise Exception("Failed to route for net " +
+                            ", ".join(unroutable_nets))
+        if not converged:
+            raise Exception("Failed to resolve congestion after " +
+                            str(self.NEGOTIATION_MAX_ITER) + " iterations")
+
+        # commit to the actual routing resource
+        for net_id in net_list_ids:
+            paths = net_paths[net_id]
+            for path_id in paths:
+                self.route_result[path_id] = paths[path_id]
+                self.update_routing_resource(self.routing_resource,
+                                             paths[path_id])
+        self.routing_resource.commit()
+
+    def get_link_cost(self, pos, wire):
+        """cost of driving switch box out wire at pos. it's always 1 (a hop)
+           unless we are negotiating congestion. the congestion cost of
+           timing-critical nets is traded for the delay of the hop"""
+        if self.wire_usage is None:
+            return 1
+        key = (pos, wire)
+        present = len(self.wire_usage.get(key, ()))
+        history = self.history_cost.get(key, 0)
+        cost = (1 + history) * (1 + self.present_factor * present)
+        if self.current_criticality == 0:
+            return cost
+        criticality = self.current_criticality
+        return criticality + (1 - criticality) * cost
+
+    def get_pin_cost(self, pin_info):
+        if len(pin_info) == 4:
+            # self-connection uses an extra out wire
+            _, conn, pos, _ = pin_info
+            return self.get_link_cost(pos, conn)
+        return 0
+
+    def compute_route_cost(self, route_length, paths):
+        cost = route_length
+        for path in paths:
+            for pos, wire in self.get_path_wires(path):
+                cost += self.get_link_cost(pos, wire) - 1
+        return cost
+
+    def enable_timing(self, netlist_json):
+        """route timing-critical nets first based on the criticality
+           estimated from the netlist, which is updated as nets get routed"""
+        _, instances = read_netlist_json(netlist_json)
+        self.blk_delay = {}
+        for net_id in self.netlists:
+            blk_id, blk_port = self.netlists[net_id][0]
+            if blk_port == "reg":
+                continue
+            self.blk_delay[blk_id] = get_blk_delay(blk_id, blk_port,
+                                                   self.id_to_name, instances,
+                                                   self.changed_pe)
+        self.timed_blks = set()
+        for blk_id in self.id_to_name:
+            if is_timed_element(self.id_to_name[blk_id], blk_id):
+                self.timed_blks.add(blk_id)
+        # in case of reg folding
+        self.timed_blks.update(self.changed_pe)
+        self.net_criticality = {}
+        self.update_criticality()
+
+    def update_criticality(self, route_result=None):
+        """re-compute the net criticality. routed nets use the hops of their
+           paths and the rest use the manhattan distance. returns the
+           estimated critical path delay"""
+        if route_result is None:
+            route_result = self.route_result
+        net_hops = {}
+
+        def wire_delay(net_id, dst):
+            dst_pos = self.placement[dst[0]]
+            if net_id in route_result:
+                if net_id not in net_hops:
+                    net_hops[net_id] = self.get_path_hops(
+                        route_result[net_id])
+                hops = net_hops[net_id].get(dst_pos)
+            else:
+                hops = None
+            if hops is None:
+                src_pos = self.placement[self.netlists[net_id][0][0]]
+                hops = self.manhattan_dist(src_pos, dst_pos)
+            return TIMING_INFO["sb"] * hops + TIMING_INFO["cb"]
+
+        self.net_criticality, self.critical_delay = \
+            compute_net_criticality(self.netlists, self.blk_delay,
+                                    self.timed_blks, wire_delay)
+        return self.critical_delay
+
+    def sort_by_criticality(self, net_ids):
+        """critical nets first. IO nets stay in front"""
+        def sort(net_id):
+            for blk_id, _ in self.netlists[net_id]:
+                if blk_id[0] == "i":
+                    return 0, -self.net_criticality.get(net_id, 0)
+            return 1, -self.net_criticality.get(net_id, 0)
+        return sorted(net_ids, key=sort)
 
-            # update the actual routing resource
-            # self-loop is fixed up
-            self.routing_resource = chan_resources[min_chan]
+    @staticmethod
+    def get_path_hops(path):
+        """number of switch box hops from the src to every position of the
+           path"""
+        hops = {}
+        for pin_info in path:
+            if len(pin_info) == 1:
+                p, _, dir_out, _ = pin_info[0]
+                hops.setdefault(p, 0)
+                dx, dy = RoutingGraph.SIDE_OFFSET[get_wire_side(dir_out)]
+                hops.setdefault((p[0] + dx, p[1] + dy), hops[p] + 1)
+            elif len(pin_info) == 2:
+                (p1, _), (p2, _) = pin_info
+                hops.setdefault(p2, hops.get(p1, 0) + 1)
+        return hops
+
+    @staticmethod
+    def get_path_wires(path):
+        """returns switch box out wires used by the path as (pos, wire).
+           in wires are covered by the out wires of the neighbors"""
+        wires = set()
+        for pin_info in path:
+            if len(pin_info) == 1:
+                # src
+                p, _, dir_out, _ = pin_info[0]
+                wires.add((p, dir_out))
+            elif len(pin_info) == 2:
+                # passing through
+                p, dir_out = pin_info[0]
+                wires.add((p, dir_out))
+            elif len(pin_info) == 3:
+                _, pos, port = pin_info
+                if isinstance(port, int):
+                    # re-written reg sink
+                    wires.add((pos, port))
+            elif len(pin_info) == 4:
+                # self-connection sink
+                _, conn, pos, _ = pin_info
+                wires.add((pos, conn))
+        return wires
+
+    @staticmethod
+    def get_path_pins(path):
+        """returns the src and sink pins of the path as (pos, port)"""
+        pins = set()
+        for pin_info in path:
+            if len(pin_info) == 1:
+                p, port, _, _ = pin_info[0]
+                pins.add((p, port))
+            elif len(pin_info) == 3:
+                _, pos, port = pin_info
+                if isinstance(port, int):
+                    # re-written reg sink
+                    port = "reg"
+                pins.add((pos, port))
+            elif len(pin_info) == 4:
+                _, _, pos, port = pin_info
+                pins.add((pos, port))
+        return pins
 
     @staticmethod
-    def find_closet_src(pos, final_path, is_reg_net=False):
+    def find_closet_srcs(pos, final_path, is_reg_net=False):
+        """positions of final_path to route to pos from, the closest first"""
         # Keyi:
         # reg_net introduces some complications on where to find the closest
         # src points
@@ -569,11 +1450,47 @@ class Router:
         keys.sort(key=lambda x: distance[x])
         if len(keys) == 0:
             assert skipped_pos is not None
-            return skipped_pos
-        return keys[0]
+            return [skipped_pos]
+        return keys
+
+    def get_tree_seeds(self, final_path, net_src_pos, src_port):
+        """positions of the routed tree, i.e. what find_closet_srcs picks
+           from, and the track in to continue from them. None means starting
+           from the src port"""
+        seeds = {}
+        for conn in final_path:
+            if len(conn) == 1:
+                p = conn[0][0]
+            elif len(conn) == 2:
+                p = conn[0][0]
+            elif len(conn) == 3:
+                _, p, port = conn
+                if port == "reg":
+                    continue
+            else:
+                p = conn[2]
+            if p in seeds:
+                continue
+            if p == net_src_pos:
+                seeds[p] = None
+                continue
+            found, track_in = self.get_track_in_from_path(p, src_port,
+                                                          final_path)
+            seeds[p] = track_in if found else None
+        return seeds
+
+    def get_net_lower_bound(self, net):
+        """lower bound of the route length of the net, excluding its linked
+           reg nets. every sink takes a path entry and the hops have to span
+           the bounding box of the pins"""
+        xs = [self.placement[blk_id][0] for blk_id, _ in net]
+        ys = [self.placement[blk_id][1] for blk_id, _ in net]
+        return max(xs) - min(xs) + max(ys) - min(ys) + len(net) - 1
 
     def route_net(self, bus, chan, net, routing_resource, final_path=None,
-                  is_src=True, pos_set=None, reg_pos=None):
+                  is_src=True, pos_set=None, reg_pos=None, max_length=None):
+        """route the net on the channel. if max_length is given, the route
+           is abandoned as soon as it can't be shorter than max_length"""
         src_id, src_port = net[0]
         pin_port_set = determine_pin_ports(net,
                                            self.placement,
@@ -593,8 +1510,6 @@ class Router:
         # tile
         dst_set = net[1:]
         src_pos = self.placement[src_id]
-        # local routing resource
-        routing_resource = self.copy_resource(routing_resource)
         # Keyi:
         # because of the way it updates routing resource, the router is not
         # allowed to re-visit a pos it's been used for routing. It's fine until
@@ -622,25 +1537,54 @@ class Router:
             dst_point = dst_set.pop(0)
             dst_id, dst_port = dst_point
             dst_pos = self.placement[dst_id]
-            self.allow_chan(dst_pos, pos_set)
+            self.allow_chan(dst_pos, dst_port, bus, chan, routing_resource,
+                            pos_set)
 
             # get the new src position from the path we've already routed
             # > 1 because we don't want to interfere with reg net routing
+            seeds = None
+            src_candidates = []
             if len(final_path) > 1:
-                src_pos = self.find_closet_src(dst_pos, final_path, is_reg_net)
-                if src_pos == self.placement[src_id]:
-                    is_src = True
+                if self.steiner and not is_reg_net:
+                    seeds = self.get_tree_seeds(final_path,
+                                                self.placement[src_id],
+                                                src_port)
+                    if dst_pos in seeds:
+                        # self loop is handled below
+                        seeds = None
+                if seeds is None:
+                    src_candidates = self.find_closet_srcs(dst_pos,
+                                                           final_path,
+                                                           is_reg_net)
+                    src_pos = src_candidates.pop(0)
+                    if src_pos == self.placement[src_id]:
+                        is_src = True
+                else:
+                    src_pos = self.placement[src_id]
 
             # self loop prevention
             # this will happen if two operands share the same input
             # in a single block
+            pre_pos = None
             if dst_pos == src_pos:
                 pre_pos = self.find_pre_track_in(dst_pos, final_path)
-                available, pin_info = \
-                    self.is_pin_available(routing_resource,
-                                          pre_pos, dst_pos, dst_port,
-                                          bus, chan,
-                                          is_self_connection=True)
+                if pre_pos is None and len(src_candidates) > 0:
+                    # the net never comes into dst_pos, e.g. it's the src
+                    # itself, so there is nothing to loop back from. come
+                    # back in from the next closest position instead
+                    src_pos = src_candidates.pop(0)
+                    is_src = src_pos == self.placement[src_id]
+            if dst_pos == src_pos:
+                if pre_pos is None:
+                    available = False
+                else:
+                    if self.search_stats is not None:
+                        self.search_stats["pin_checks"] += 1
+                    available, pin_info = \
+                        self.is_pin_available(routing_resource,
+                                              pre_pos, dst_pos, dst_port,
+                                              bus, chan,
+                                              is_self_connection=True)
 
                 if not available:
                     # failed to connect
@@ -659,18 +1603,38 @@ class Router:
                                                final_path,
                                                pos_set,
                                                routing_resource,
-                                               force_connect=force_connect)
+                                               force_connect=force_connect,
+                                               seeds=seeds)
                 force_connect = False
+                # the closest position may be walled in by the tree itself.
+                # try the others before giving up on this chan
+                while (dst_pos, dst_port) not in link and \
+                        len(src_candidates) > 0:
+                    src_pos = src_candidates.pop(0)
+                    if src_pos == dst_pos:
+                        continue
+                    is_src = src_pos == self.placement[src_id]
+                    link = self.connect_two_points((src_pos, src_port),
+                                                   (dst_id,
+                                                    dst_pos, dst_port),
+                                                   bus,
+                                                   chan,
+                                                   pin_port_set,
+                                                   is_src,
+                                                   final_path,
+                                                   pos_set,
+                                                   routing_resource)
             if (dst_pos, dst_port) not in link:
                 # failed to route in this channel
                 path_length = self.MAX_PATH_LENGTH
                 # early termination
                 break
             # merge the search path to channel path
+            start_points = {src_pos} if seeds is None else seeds
             pp = dst_pos
             # pos_set.add(pp)
             path = []
-            while pp != src_pos:
+            while pp not in start_points:
                 path.append(link[pp])
 
                 pos_set.add(link[pp][0])
@@ -697,6 +1661,14 @@ class Router:
                 # skip the first one since src and dst overlap
                 final_path = final_path + path
 
+            # every sink left takes at least one more entry
+            if max_length is not None and \
+                    len(final_path) + len(dst_set) >= max_length:
+                path_length = self.MAX_PATH_LENGTH
+                if self.search_stats is not None:
+                    self.search_stats["outcome"] = "pruned"
+                break
+
             # disable the src since we're moving along the net
             is_src = False
         # update the routing info
@@ -726,7 +1698,7 @@ class Router:
             else:
                 raise Exception("Unknown path")
             if pos == src_pos:
-                assert (src_conn[1] == 0)
+                assert (get_wire_io(src_conn) == 0)
                 return True, src_conn
         # couldn't find it
         # going forwards to see if it comes directly from a src
@@ -739,7 +1711,7 @@ class Router:
                     pos, _ = path[i + 1][0]
                     if pos == src_pos:
                         _, _, _, src_conn = path[i][0]
-                        assert (src_conn[1] == 0)
+                        assert (get_wire_io(src_conn) == 0)
                         return True, src_conn
         # last resort:
         # if it's a reg net and coming directly from a port
@@ -747,7 +1719,7 @@ class Router:
             assert len(path) == 1
             pos, _, _, src_conn = path[0][0]
             assert Router.manhattan_dist(pos, src_pos) == 1
-            assert (src_conn[1] == 0)
+            assert (get_wire_io(src_conn) == 0)
             return True, src_conn
         raise Exception("Unable to find track in")
 
@@ -854,25 +1826,69 @@ class Router:
 
     def connect_two_points(self, src, dst, bus, chan, pin_ports,
                            is_src, final_path,
-                           pos_set, routing_resource, force_connect=False):
+                           pos_set, routing_resource, force_connect=False,
+                           seeds=None):
+        """A* from src to dst. if seeds, i.e. the positions of the routed
+           tree and their track in, is given, the search starts from all of
+           them at once"""
         src_pos, src_port = src
         (dst_id, dst_pos, dst_port) = dst
-        working_set = []
+        if self.bidirectional and seeds is None and not force_connect and \
+                self.wire_usage is None and \
+                routing_resource.graph is not None and \
+                (dst_pos, dst_port) in pin_ports and \
+                self.manhattan_dist(src_pos, dst_pos) >= \
+                self.BIDIRECTIONAL_MIN_DIST:
+            return self.connect_two_points_bidirectional(src, dst, bus, chan,
+                                                         pin_ports, is_src,
+                                                         final_path, pos_set,
+                                                         routing_resource)
+        # the search state is a position with its track in, since the turns
+        # and the sink pin available at a position depend on where it's
+        # entered from. depth holds the best known cost to each state,
+        # parent the state and the path entry it's reached from and
+        # finished_set the closed states. working_set is a heap of
+        # (heuristic, push order, state), where the push order breaks ties
+        # in FIFO order and skips comparing the states
         finished_set = set()
-        link = {}
-        working_set.append(src_pos)
-        terminate = False
-        depth = {src_pos: 0}
-        track_in = None
-        while len(working_set) > 0 and not terminate:
+        parent = {}
+        depth = {}
+        # positions reached by any state. a path can't visit a position
+        # twice, which is only checked for the ones in here
+        reached = set()
+        working_set = []
+        push_count = 0
+        start_points = [src_pos] if seeds is None else sorted(seeds)
+        start_set = set(start_points)
+        for start_point in start_points:
+            track_in = None if seeds is None else seeds[start_point]
+            state = (start_point, track_in)
+            depth[state] = 0
+            reached.add(start_point)
+            dist = self.heuristic_dist(0, start_point, dst_pos, src=src_pos)
+            heapq.heappush(working_set, (dist, push_count, state))
+            push_count += 1
+        # (state, pin info) of the sink
+        sink = None
+        # only used when negotiating congestion
+        best_sink = None
+        # search statistics
+        nodes_expanded = 0
+        pin_checks = 0
+        while len(working_set) > 0 and sink is None:
             # using manhattan distance as heuristics
-            working_set.sort(
-                key=lambda pos: self.heuristic_dist(depth, pos,
-                                                    dst_pos, src=src_pos),)
-            point = working_set.pop(0)
-            if len(point) == 3:
-                point, _, track_in = point
-            finished_set.add(point)
+            dist, _, state = heapq.heappop(working_set)
+            if best_sink is not None and dist >= best_sink[0]:
+                # nothing left can reach the sink cheaper
+                break
+            if state in finished_set:
+                # stale entry, the state has been reached cheaper
+                continue
+            finished_set.add(state)
+            point, track_in = state
+            if seeds is not None and state not in parent:
+                is_src = track_in is None
+            nodes_expanded += 1
             if is_src:
                 points = self.get_port_neighbors(routing_resource, bus,
                                                  chan,
@@ -900,47 +1916,327 @@ class Router:
                                                 force_connect=force_connect)
                 force_connect = False
             for entry in points:
-                if is_src:
-                    p, dir_out, dir_in = entry
-                else:
-                    p, dir_out, dir_in = entry
-                if p in finished_set or entry in working_set or \
+                p, dir_out, dir_in = entry
+                next_state = (p, dir_in)
+                if next_state in finished_set or p in start_set or \
                         p in pos_set or (point, dir_out) in pos_set or \
                         (p, dir_in) in pos_set:
-                    # we have already explored this position
+                    # we have already explored this state
+                    continue
+                if p in reached and \
+                        self.is_on_search_path(parent, state, p):
+                    # the path would go through the position twice
+                    continue
+                cost = depth[state] + self.get_link_cost(point, dir_out)
+                if next_state in depth and depth[next_state] <= cost:
+                    # it's been reached with lower cost
                     continue
                 # point backwards
                 if is_src:
                     assert(point == src_pos)
-                    link[p] = [(point, src_port, dir_out, dir_in)]
+                    link_entry = [(point, src_port, dir_out, dir_in)]
                 else:
-                    link[p] = ((point, dir_out), (p, dir_in))
-                depth[p] = depth[point] + 1
+                    link_entry = ((point, dir_out), (p, dir_in))
                 if p == dst_pos:
                     # we have found it!
                     # but hang on as we need to make sure the
                     # pin resource is available
-                    if (dst_pos, dst_port) in pin_ports:
-                        available, pin_info = \
-                            self.is_pin_available(routing_resource,
-                                                  point, p,
-                                                  dst_port,
-                                                  bus,
-                                                  chan)
-                        if not available:
-                            # we're doomed for this chan
-                            # re-route!
-                            link.pop(p, None)
-                            depth.pop(p, None)
-                        else:
-                            link[(p, dst_port)] = pin_info
-                            terminate = True
-                            break
-                else:
-                    working_set.append(entry)
+                    if (dst_pos, dst_port) not in pin_ports:
+                        continue
+                    pin_checks += 1
+                    available, pin_info = \
+                        self.is_pin_available(routing_resource,
+                                              point, p,
+                                              dst_port,
+                                              bus,
+                                              chan)
+                    if not available:
+                        # the sink may still be reached from other
+                        # directions
+                        continue
+                    depth[next_state] = cost
+                    parent[next_state] = (state, link_entry)
+                    if self.wire_usage is None:
+                        sink = (next_state, pin_info)
+                        break
+                    # congestion cost is not uniform, so we have to
+                    # keep searching till the sink is the cheapest
+                    cost += self.get_pin_cost(pin_info)
+                    if best_sink is None or cost < best_sink[0]:
+                        best_sink = (cost, next_state, pin_info)
+                    continue
+                depth[next_state] = cost
+                parent[next_state] = (state, link_entry)
+                reached.add(p)
+                dist = self.heuristic_dist(cost, p, dst_pos, src=src_pos)
+                heapq.heappush(working_set, (dist, push_count, next_state))
+                push_count += 1
 
             # we're done with the src
             is_src = False
+        if sink is None and best_sink is not None:
+            sink = best_sink[1:]
+        if self.search_stats is not None:
+            self.search_stats["nodes_expanded"] += nodes_expanded
+            self.search_stats["pin_checks"] += pin_checks
+        # route_net follows the link back from the sink by position
+        link = {}
+        if sink is not None:
+            state, pin_info = sink
+            link[(dst_pos, dst_port)] = pin_info
+            while state in parent:
+                prev_state, entry = parent[state]
+                link[state[0]] = entry
+                state = prev_state
+        return link
+
+    @staticmethod
+    def is_on_search_path(parent, state, pos):
+        """whether the path to the search state goes through pos"""
+        while True:
+            if state[0] == pos:
+                return True
+            if state not in parent:
+                return False
+            state = parent[state][0]
+
+    def connect_two_points_bidirectional(self, src, dst, bus, chan,
+                                         pin_ports, is_src, final_path,
+                                         pos_set, routing_resource):
+        """connect_two_points that searches from both the src and the sink
+           pin on the routing graph and meets in the middle. the forward
+           state is a position with its track in, the backward one a
+           position with the switch box out wire it leaves through; a
+           meeting is valid if the track in can connect to the out wire.
+           every hop costs 1, so it's not used when negotiating congestion"""
+        src_pos, src_port = src
+        (dst_id, dst_pos, dst_port) = dst
+        graph = routing_resource.graph
+        nodes_expanded = 0
+        pin_checks = 0
+
+        # forward search state, same as connect_two_points. f_tracks and
+        # b_wires hold the states reached at each position, to find the
+        # meetings
+        src_state = (src_pos, None)
+        f_parent = {}
+        f_depth = {src_state: 0}
+        f_finished = set()
+        f_tracks = {}
+        f_heap = [(self.manhattan_dist(src_pos, dst_pos), 0, src_state)]
+        # backward search state. b_succ holds the next state towards the
+        # sink and the path entry to it
+        b_succ = {}
+        b_depth = {}
+        b_finished = set()
+        b_wires = {}
+        b_heap = []
+        b_pin = {}
+        push_count = 1
+        # best complete path found so far: (cost, forward state,
+        # backward state, pin info)
+        best = None
+
+        def get_b_last(state):
+            while b_succ[state][0] is not None:
+                state = b_succ[state][0]
+            return state
+
+        def is_on_b_path(state, pos):
+            while state is not None:
+                if state[0] == pos:
+                    return True
+                state = b_succ[state][0]
+            return False
+
+        def meet(f_state, b_state):
+            """returns the path through the two states, if valid"""
+            pos, track_in = f_state
+            if not graph.has_conn(pos, track_in, b_state[1]):
+                return None
+            # a position can only be used once per connection
+            f_positions = set()
+            state = f_state
+            while state in f_parent:
+                state = f_parent[state][0]
+                f_positions.add(state[0])
+            state = b_succ[b_state][0]
+            while state is not None:
+                if state[0] in f_positions:
+                    return None
+                state = b_succ[state][0]
+            return (f_depth[f_state] + b_depth[b_state], f_state, b_state,
+                    b_pin[get_b_last(b_state)])
+
+        # the backward search starts from the positions that can drive the
+        # sink pin
+        for side in sorted(graph.SIDE_OFFSET):
+            dx, dy = graph.SIDE_OFFSET[side]
+            pos = (dst_pos[0] + dx, dst_pos[1] + dy)
+            if pos == src_pos or pos not in routing_resource:
+                continue
+            dir_out = encode_wire(bus, 1, (side + 2) % 4, chan)
+            dir_in = encode_wire(bus, 0, side, chan)
+            if pos in pos_set or (pos, dir_out) in pos_set or \
+                    (dst_pos, dir_in) in pos_set or \
+                    not graph.has_conn_out(pos, dir_out):
+                continue
+            pin_checks += 1
+            available, pin_info = self.is_pin_available(routing_resource,
+                                                        pos, dst_pos,
+                                                        dst_port, bus, chan)
+            if not available:
+                continue
+            state = (pos, dir_out)
+            b_succ[state] = (None, ((pos, dir_out), (dst_pos, dir_in)))
+            b_depth[state] = 1
+            b_pin[state] = pin_info
+            b_wires.setdefault(pos, set()).add(dir_out)
+            heapq.heappush(b_heap, (1 + self.manhattan_dist(pos, src_pos),
+                                    push_count, state))
+            push_count += 1
+        if len(b_heap) == 0:
+            # src is never next to the sink here, so nothing can reach the
+            # sink pin. no need to flood the board to find that out
+            f_heap = []
+
+        while len(f_heap) > 0 or len(b_heap) > 0:
+            # a path not found yet goes through a state left on each side,
+            # so it costs at least both heap keys; once the best is no more
+            # than either of them, it's the shortest. with one side empty,
+            # every path has been found. the tie breaker isn't used since
+            # the keys have to be lower bounds
+            if best is not None:
+                f_top = f_heap[0][0] if len(f_heap) > 0 else best[0]
+                b_top = b_heap[0][0] if len(b_heap) > 0 else best[0]
+                if best[0] <= max(f_top, b_top):
+                    break
+            # expand the smaller frontier
+            if len(b_heap) == 0 or (len(f_heap) > 0 and
+                                    len(f_heap) <= len(b_heap)):
+                _, _, state = heapq.heappop(f_heap)
+                if state in f_finished:
+                    continue
+                f_finished.add(state)
+                point, track_in = state
+                nodes_expanded += 1
+                if is_src:
+                    points = self.get_port_neighbors(routing_resource, bus,
+                                                     chan, point, src_port)
+                else:
+                    if track_in is None:
+                        found, track_in = self.get_track_in_from_path(
+                            src_pos, src_port, final_path)
+                    if track_in is None:
+                        points = self.get_port_neighbors(routing_resource,
+                                                         bus, chan, point,
+                                                         src_port)
+                        is_src = True
+                    else:
+                        points = self.get_neighbors(routing_resource, bus,
+                                                    chan, point, track_in,
+                                                    pin_ports)
+                for entry in points:
+                    p, dir_out, dir_in = entry
+                    next_state = (p, dir_in)
+                    if next_state in f_finished or p == src_pos or \
+                            p in pos_set or (point, dir_out) in pos_set or \
+                            (p, dir_in) in pos_set:
+                        continue
+                    if p in f_tracks and \
+                            self.is_on_search_path(f_parent, state, p):
+                        continue
+                    cost = f_depth[state] + 1
+                    if next_state in f_depth and f_depth[next_state] <= cost:
+                        continue
+                    if is_src:
+                        link_entry = [(point, src_port, dir_out, dir_in)]
+                    else:
+                        link_entry = ((point, dir_out), (p, dir_in))
+                    if p == dst_pos:
+                        if best is not None and cost >= best[0]:
+                            continue
+                        pin_checks += 1
+                        available, pin_info = \
+                            self.is_pin_available(routing_resource, point, p,
+                                                  dst_port, bus, chan)
+                        if available:
+                            f_depth[next_state] = cost
+                            f_parent[next_state] = (state, link_entry)
+                            best = (cost, next_state, None, pin_info)
+                        continue
+                    f_depth[next_state] = cost
+                    f_parent[next_state] = (state, link_entry)
+                    f_tracks.setdefault(p, set()).add(dir_in)
+                    for wire in sorted(b_wires.get(p, [])):
+                        path = meet(next_state, (p, wire))
+                        if path is not None and \
+                                (best is None or path[0] < best[0]):
+                            best = path
+                    dist = cost + self.manhattan_dist(p, dst_pos)
+                    heapq.heappush(f_heap, (dist, push_count, next_state))
+                    push_count += 1
+                is_src = False
+            else:
+                _, _, state = heapq.heappop(b_heap)
+                if state in b_finished:
+                    continue
+                b_finished.add(state)
+                point, out_wire = state
+                nodes_expanded += 1
+                node = graph.get_node(point, out_wire)
+                for in_node in graph.get_conn_in(node):
+                    dir_in = graph.node_wires[in_node]
+                    bus_in, _, side, track = decode_wire(dir_in)
+                    if bus_in != bus or track != chan or \
+                            side not in graph.SIDE_OFFSET:
+                        continue
+                    prev_node = graph.prev_node[in_node]
+                    if prev_node < 0 or graph.in_degree[prev_node] == 0:
+                        continue
+                    dx, dy = graph.SIDE_OFFSET[side]
+                    p = (point[0] + dx, point[1] + dy)
+                    dir_out = graph.node_wires[prev_node]
+                    next_state = (p, dir_out)
+                    if p == src_pos or p == dst_pos or \
+                            next_state in b_finished or \
+                            p in pos_set or (p, dir_out) in pos_set or \
+                            (point, dir_in) in pos_set:
+                        continue
+                    if p in b_wires and is_on_b_path(state, p):
+                        continue
+                    cost = b_depth[state] + 1
+                    if next_state in b_depth and b_depth[next_state] <= cost:
+                        continue
+                    b_depth[next_state] = cost
+                    b_succ[next_state] = (state,
+                                          ((p, dir_out), (point, dir_in)))
+                    b_wires.setdefault(p, set()).add(dir_out)
+                    for track_in in sorted(f_tracks.get(p, [])):
+                        path = meet((p, track_in), next_state)
+                        if path is not None and \
+                                (best is None or path[0] < best[0]):
+                            best = path
+                    heapq.heappush(b_heap,
+                                   (cost + self.manhattan_dist(p, src_pos),
+                                    push_count, next_state))
+                    push_count += 1
+
+        if self.search_stats is not None:
+            self.search_stats["nodes_expanded"] += nodes_expanded
+            self.search_stats["pin_checks"] += pin_checks
+        link = {}
+        if best is None:
+            return link
+        _, state, b_state, pin_info = best
+        while state in f_parent:
+            prev_state, entry = f_parent[state]
+            link[state[0]] = entry
+            state = prev_state
+        while b_state is not None:
+            b_state, entry = b_succ[b_state]
+            link[entry[1][0]] = entry
+        link[(dst_pos, dst_port)] = pin_info
         return link
 
     def update_routing_resource(self, routing_resource, path):
@@ -951,90 +2247,59 @@ class Router:
 
                 # disable any out -> port or port -> out
                 for p_port in routing_resource[p]["port"]:
-                    ports = routing_resource[p]["port"][p_port]
-                    if dir_out in ports:
-                        ports.remove(dir_out)
+                    routing_resource.remove_port_conn(p, p_port, dir_out)
                 # if port != "reg":
                 #     ports = routing_resource[p]["port"][port]
                 #     ports.remove(dir_out)
                 # else:
                 #    assert self.fold_reg
                 # also remove the routing resource
-                res = self.get_route_resource(self.board_meta,
-                                              routing_resource,
-                                              p)
-                conn_remove = set()
-                for conn1, conn2 in res:
-                    if conn2 == dir_out:
-                        conn_remove.add((conn1, conn2))
-                for entry in conn_remove:
-                    res.remove(entry)
+                routing_resource.remove_conn_out(p, dir_out)
             if len(pin_info) == 2:
                 # passing through
                 p1, dir_out = pin_info[0]
                 p2, dir_in = pin_info[1]
-                res1 = self.get_route_resource(self.board_meta,
-                                               routing_resource,
-                                               p1)
-                res2 = self.get_route_resource(self.board_meta,
-                                               routing_resource,
-                                               p2)
 
                 # out is the first one and in is the second one
-                conn_remove = set()
-                for conn1, conn2 in res1:
-                    if conn2 == dir_out:
-                        conn_remove.add((conn1, conn2))
-                for entry in conn_remove:
-                    res1.remove(entry)
+                routing_resource.remove_conn_out(p1, dir_out)
                 # also disable any in/out port that can connect to this tile
                 port_resource = self.get_port_resource(self.board_meta,
                                                        routing_resource,
                                                        p1)
                 for port in port_resource:
-                    port_conn = port_resource[port]
-                    if dir_out in port_conn:
-                        port_conn.remove(dir_out)
+                    routing_resource.remove_port_conn(p1, port, dir_out)
 
-                conn_remove = set()
-                for conn1, conn2 in res2:
-                    if conn1 == dir_in:
-                        conn_remove.add((conn1, conn2))
-                for entry in conn_remove:
-                    res2.remove(entry)
+                routing_resource.remove_conn_in(p2, dir_in)
 
                 # also disable any in/out port that can connect to this tile
                 port_resource = self.get_port_resource(self.board_meta,
                                                        routing_resource,
                                                        p2)
                 for port in port_resource:
-                    port_conn = port_resource[port]
-                    if dir_in in port_conn:
-                        port_conn.remove(dir_in)
+                    routing_resource.remove_port_conn(p2, port, dir_in)
             elif len(pin_info) == 3:
-                if not(isinstance(pin_info[-1], str)):
+                if not(isinstance(pin_info[-1], (str, int))):
                     raise Exception("Unknown pin_info " + str(pin_info))
                 # no turn sink
                 # need to delete the port path
                 # it might be redundant for PE tiles, but for IO ports
                 # it's critical?
                 conn, pos, port = pin_info
-                if port == "reg":
+                if isinstance(port, int):
+                    # reg sink that has been re-written by the reg net,
+                    # i.e. in -> out (reg)
+                    assert self.fold_reg
+                    dir_out = port
+                elif port == "reg":
                     assert self.fold_reg
+                    dir_out = None
                 else:
-                    ports = routing_resource[pos]["port"][port]
-                    if conn in ports:
-                        ports.remove(conn)
+                    routing_resource.remove_port_conn(pos, port, conn)
+                    dir_out = None
                 # disable any coming in connections
-                res = self.get_route_resource(self.board_meta,
-                                              routing_resource,
-                                              pos)
-                conn_remove = set()
-                for conn1, conn2 in res:
-                    if conn1 == conn:
-                        conn_remove.add((conn1, conn2))
-                for entry in conn_remove:
-                    res.remove(entry)
+                routing_resource.remove_conn_in(pos, conn)
+                if dir_out is not None:
+                    routing_resource.remove_conn_out(pos, dir_out)
 
             elif len(pin_info) == 4:
                 # need to take care of the extra out
@@ -1042,52 +2307,52 @@ class Router:
                 dir_in = pin_info[0]
                 conn = pin_info[1]  # conn is out
                 pos = pin_info[2]
-                res = routing_resource[pos]["route_resource"]
-                conn_remove = set()
-                for conn1, conn2 in res:
-                    if conn2 == conn:
-                        conn_remove.add((conn1, conn2))
-                    elif conn1 == dir_in:
-                        conn_remove.add((conn1, conn2))
-                for entry in conn_remove:
-                    res.remove(entry)
+                routing_resource.remove_conn_out(pos, conn)
+                routing_resource.remove_conn_in(pos, dir_in)
                 # ports = routing_resource[pos]["port"][pin_info[-1]]
                 # ports.remove(conn)
 
                 # disable any port output to it
                 for port in routing_resource[pos]["port"]:
-                    ports = routing_resource[pos]["port"][port]
-                    if conn in ports:
-                        ports.remove(conn)
+                    routing_resource.remove_port_conn(pos, port, conn)
+
+    def get_congestion_map(self):
+        """occupancy of the switch box wires, indexed by (y, x, bus, track).
+           it's the fraction of the wires that can't be used as conn_in
+           anymore. buses are in the order of routing_resource.wire_buses"""
+        routing_resource = self.routing_resource
+        capacity = routing_resource.wire_capacity
+        used = capacity - routing_resource.wire_free
+        congestion = np.zeros(capacity.shape)
+        np.divide(used, capacity, out=congestion, where=capacity > 0)
+        return congestion
+
+    def get_channels_left(self, bus=16):
+        """number of wires of the bus that can still be used as conn_in,
+           indexed by (x, y)"""
+        routing_resource = self.routing_resource
+        bus_index = routing_resource.wire_buses.index(bus)
+        channels_left = routing_resource.wire_free[:, :, bus_index, :]
+        channels_left = channels_left.sum(axis=-1).T
+        result = np.zeros(self.board_size, dtype=channels_left.dtype)
+        width, height = channels_left.shape
+        result[:width, :height] = channels_left
+        return result
 
     def compute_stats(self):
-        top_10 = []
         margin = self.board_meta[-1]["margin"]
-        height = self.board_meta[-1]["height"]
-        width = self.board_meta[-1]["width"]
-        for i in range(self.board_size[0]):
-            for j in range(self.board_size[1]):
-                if \
-                        (i in range(0, margin) or j in range(0, margin) or
-                         i in range(height - margin, height) or
-                         j in range(width - margin, width)):  # IO is special:
-                    continue
-                else:
-                    route_r = self.get_route_resource(self.board_meta,
-                                                      self.routing_resource,
-                                                      (i, j))
-                    un_used_16 = set()
-                    for conn1, conn2 in route_r:
-                        if conn1[0] == 16:
-                            un_used_16.add(conn1)
-                    res = np.sum(len(un_used_16))
-                    top_10.append(((i, j), res))
-                    if len(top_10) > 10:
-                        top_10.sort(key=lambda x: x[1])
-                        top_10.pop(len(top_10) - 1)
+        width, height = self.board_size
+        channels_left = self.get_channels_left()
+        # IO is special
+        mask = np.zeros(self.board_size, dtype=np.bool_)
+        mask[margin:width - margin, margin:height - margin] = True
+        positions = np.argwhere(mask)
+        res = channels_left[mask]
+        top_10 = np.argsort(res, kind="mergesort")[:10]
         print("Top 10 most used tiles:")
-        for pos, res in top_10:
-            print(pos, "\tchannels left:", res)
+        for index in top_10:
+            pos = tuple(int(i) for i in positions[index])
+            print(pos, "\tchannels left:", res[index])
 
     def vis_routing_resource(self):
         scale = 30
@@ -1095,27 +2360,20 @@ class Router:
         height = self.board_meta[-1]["height"]
         width = self.board_meta[-1]["width"]
         im, draw = draw_board(self.board_size[0], self.board_size[1], scale)
+        channels_left = self.get_channels_left()
+        # mem tiles strike again!
+        # if self.layout_board[j][i] == "m" or \
+        #         self.layout_board[j - 1][i] == "m":
+        #     res /= 2
+        colors = (255 * channels_left / 4 / self.channel_width).astype(int)
+        # IO is special
+        colors[:margin, :] = 255
+        colors[:, :margin] = 255
+        colors[width - margin:, :] = 255
+        colors[:, height - margin:] = 255
         for i in range(self.board_size[0]):
             for j in range(self.board_size[1]):
-                if  \
-                        (i in range(0, margin) or j in range(0, margin) or
-                         i in range(height - margin, height) or
-                         j in range(width - margin, width)):    # IO is special:
-                    color = 255
-                else:
-                    route_r = self.get_route_resource(self.board_meta,
-                                                      self.routing_resource,
-                                                      (i, j))
-                    un_used_16 = set()
-                    for conn1, conn2 in route_r:
-                        if conn1[0] == 16:
-                            un_used_16.add(conn1)
-                    res = np.sum(len(un_used_16))
-                    # mem tiles strike again!
-                    # if self.layout_board[j][i] == "m" or \
-                    #         self.layout_board[j - 1][i] == "m":
-                    #     res /= 2
-                    color = int(255 * res / 4 / self.channel_width)
+                color = int(colors[i, j])
                 draw_cell(draw, (i, j), color=(255 - color, 0, color),
                           scale=scale)
         plt.axis('off')
@@ -1130,6 +2388,100 @@ class Router:
             print("Image saved to", output_path)
 
 
+def route_worker(router, conn, linked_nets, reg_net_order):
+    """trial worker for Router.route. its copy of the routing resource is
+       kept in sync with the removals committed since its last task, which
+       are sent along with every task"""
+    routing_resource = router.routing_resource
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        removals, net_tasks = task
+        routing_resource.replay(removals)
+        routing_resource.commit()
+        try:
+            results = []
+            for net_id, chans in net_tasks:
+                results.append(router.route_net_channels(net_id, linked_nets,
+                                                         reg_net_order,
+                                                         routing_resource,
+                                                         chans=chans))
+        except Exception as ex:
+            results = ex
+        conn.send(results)
+    conn.close()
+
+
+# router shared by the placement workers. set before the pool is forked
+batch_router = None
+
+
+def init_placement_worker(router):
+    global batch_router
+    batch_router = router
+
+
+def route_placement_worker(task):
+    """route one placement with the router inherited from the parent. every
+       worker only routes a single placement so that it always starts from
+       the untouched routing resource"""
+    placement_filename, route_file, negotiate, partition, binary = task
+    router = batch_router
+    result = {"placement": placement_filename, "route": route_file,
+              "status": "ok", "wirelength": None, "delay": None}
+    try:
+        # an unreadable placement fails this placement only
+        router.placement, _ = parse_placement(placement_filename)
+        if negotiate:
+            router.route_negotiated()
+        else:
+            router.route(partition=partition)
+    except Exception as ex:
+        result["status"] = str(ex) or type(ex).__name__
+        return result
+    route_result = router.get_route_result()
+    save_routing_result(route_result, route_file)
+    if binary:
+        save_binary_routing_result(route_result,
+                                   get_binary_routing_filename(route_file))
+    if router.collect_stats:
+        router.save_stats(route_file)
+    wire_length = compute_total_wire(dict(
+        (net_id, path_to_entries(path))
+        for net_id, path in route_result.items()))
+    result["wirelength"] = sum(wire_length.values())
+    if router.net_criticality is not None:
+        result["delay"] = router.update_criticality()
+    return result
+
+
+def route_placements(router, placement_filenames, jobs=1, negotiate=False,
+                     partition=False, binary=False):
+    """route several placements of the same design in a pool of workers
+       forked from the router, so the parsed architecture and routing
+       resource are shared. each route is saved next to its placement.
+       returns the result of every placement"""
+    tasks = []
+    for placement_filename in placement_filenames:
+        route_file = os.path.splitext(placement_filename)[0] + ".route"
+        tasks.append((placement_filename, route_file, negotiate, partition,
+                      binary))
+    pool = multiprocessing.Pool(jobs, initializer=init_placement_worker,
+                                initargs=(router,), maxtasksperchild=1)
+    results = []
+    try:
+        for result in pool.imap(route_placement_worker, tasks):
+            print(result["placement"] + ":", result["status"],
+                  "wirelength:", result["wirelength"],
+                  "delay:", result["delay"])
+            results.append(result)
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
 def main():
     parser = ArgumentParser("CGRA Router")
     parser.add_argument("-i", "--input", help="Packed netlist file, " +
@@ -1141,9 +2493,12 @@ def main():
                         dest="route_file")
     parser.add_argument("-c", "--cgra", help="CGRA architecture file",
                         required=True, action="store", dest="arch_filename")
-    parser.add_argument("-p", "--placement", help="Placement file",
-                        required=True, action="store",
-                        dest="placement_filename")
+    parser.add_argument("-p", "--placement", help="Placement file. If " +
+                        "more than one is given, every placement is routed " +
+                        "to its own .route next to it, and the best one " +
+                        "and its placement are copied to the output",
+                        required=True, action="store", nargs="+",
+                        dest="placement_filenames")
     parser.add_argument("--no-reg-fold", help="If set, the placer will treat " +
                                               "registers as PE tiles",
                         action="store_true",
@@ -1152,7 +2507,105 @@ def main():
                         "visualization result for routing",
                         action="store_true",
                         required=False, dest="no_vis", default=False)
+    parser.add_argument("--negotiate", help="If set, the router will use " +
+                        "negotiated congestion to rip up and re-route " +
+                        "congested nets instead of failing on them. " +
+                        "Nets that can't be routed even when sharing " +
+                        "wires are reported after the negotiation",
+                        action="store_true",
+                        required=False, dest="negotiate", default=False)
+    parser.add_argument("--compile-graph", help="If set, the router " +
+                        "will search on a compiled integer routing graph " +
+                        "instead of the routing resource sets",
+                        action="store_true",
+                        required=False, dest="compile_graph", default=False)
+    parser.add_argument("--jobs", help="Number of worker processes used " +
+                        "to route the channels of a net in parallel. " +
+                        "Only used without --negotiate. With multiple " +
+                        "placements, it's the number of placements routed " +
+                        "in parallel instead",
+                        type=int, action="store",
+                        required=False, dest="jobs", default=1)
+    parser.add_argument("--partition", help="If set, nets with " +
+                        "non-overlapping bounding boxes are routed in " +
+                        "batches, in parallel when --jobs is set",
+                        action="store_true",
+                        required=False, dest="partition", default=False)
+    parser.add_argument("--steiner", help="If set, the router will " +
+                        "search from the whole routed tree of a net " +
+                        "when connecting its next sink",
+                        action="store_true",
+                        required=False, dest="steiner", default=False)
+    parser.add_argument("--prev-route", help="Previous routing result. " +
+                        "If set, the router will keep the nets whose " +
+                        "blocks didn't move since --prev-placement and " +
+                        "only re-route the rest",
+                        action="store", required=False,
+                        dest="prev_route_file", default=None)
+    parser.add_argument("--prev-placement", help="Placement file used by " +
+                        "--prev-route",
+                        action="store", required=False,
+                        dest="prev_placement_filename", default=None)
+    parser.add_argument("--bidirectional", help="If set, the router " +
+                        "will search long connections from both ends on " +
+                        "the compiled routing graph. Connections are as " +
+                        "short as without it, but it may pick another of " +
+                        "the equally short routes, so the total " +
+                        "wirelength can differ. Implies " +
+                        "--compile-graph and isn't used with --negotiate",
+                        action="store_true",
+                        required=False, dest="bidirectional", default=False)
+    parser.add_argument("--stats", help="If set, the router will save " +
+                        "search statistics of every net and channel next " +
+                        "to the routing result as .stats.json and " +
+                        ".stats.csv",
+                        action="store_true",
+                        required=False, dest="stats", default=False)
+    parser.add_argument("--binary", help="If set, the router will also " +
+                        "save the routing result in the compact binary " +
+                        "format as .broute",
+                        action="store_true",
+                        required=False, dest="binary", default=False)
+    parser.add_argument("--checkpoint", help="If set, the router will " +
+                        "periodically save its progress as .checkpoint " +
+                        "next to the routing result, as well as when it " +
+                        "fails or is interrupted",
+                        action="store_true",
+                        required=False, dest="checkpoint", default=False)
+    parser.add_argument("--resume", help="If set, the router will continue " +
+                        "from the checkpoint saved by --checkpoint, if " +
+                        "there is one. Implies --checkpoint",
+                        action="store_true",
+                        required=False, dest="resume", default=False)
+    parser.add_argument("--timing", help="Netlist json file. If set, the " +
+                        "router will route timing-critical nets first and " +
+                        "weight their switch box hops by criticality " +
+                        "when negotiating congestion",
+                        action="store", required=False,
+                        dest="netlist_json", default=None)
+    parser.add_argument("--best", help="How the best of multiple " +
+                        "placements is picked, either wirelength or " +
+                        "timing, which needs --timing",
+                        choices=["wirelength", "timing"], action="store",
+                        required=False, dest="best", default="wirelength")
     args = parser.parse_args()
+    batch = len(args.placement_filenames) > 1
+    if batch and (args.prev_route_file is not None or args.checkpoint or
+                  args.resume):
+        parser.error("--prev-route, --checkpoint and --resume can't be " +
+                     "used with multiple placements")
+    if args.best == "timing" and args.netlist_json is None:
+        parser.error("--best timing requires --timing")
+    if (args.prev_route_file is None) != \
+            (args.prev_placement_filename is None):
+        parser.error("--prev-route and --prev-placement must be used " +
+                     "together")
+    if args.prev_route_file is not None and args.negotiate:
+        parser.error("--prev-route can't be used with --negotiate")
+    if (args.checkpoint or args.resume) and \
+            (args.negotiate or args.prev_route_file is not None):
+        parser.error("--checkpoint and --resume can't be used with " +
+                     "--negotiate or --prev-route")
 
     arch_filename = args.arch_filename
     packed_filename = args.packed_filename
@@ -1161,15 +2614,78 @@ def main():
     vis_opt = not args.no_vis
     fold_reg = not args.no_reg_fold
 
-    placement_filename = args.placement_filename
-    meta = parse_cgra(arch_filename, fold_reg=fold_reg)["CGRA"]
+    if batch:
+        # every worker parses its own placement, so that a bad one only
+        # fails that placement
+        placement_filename = ""
+    else:
+        placement_filename = args.placement_filenames[0]
+    meta = load_cgra(arch_filename, fold_reg=fold_reg)["CGRA"]
     r = Router(arch_filename, meta, packed_filename, placement_filename)
-    r.route()
+    r.steiner = args.steiner
+    r.collect_stats = args.stats
+    r.bidirectional = args.bidirectional
+    if args.compile_graph or args.bidirectional:
+        r.routing_resource.compile()
+    if args.netlist_json is not None:
+        r.enable_timing(args.netlist_json)
+    if batch:
+        results = route_placements(r, args.placement_filenames,
+                                   jobs=args.jobs, negotiate=args.negotiate,
+                                   partition=args.partition,
+                                   binary=args.binary)
+        results = [result for result in results if result["status"] == "ok"]
+        if len(results) == 0:
+            raise Exception("Failed to route any placement")
+        key = "delay" if args.best == "timing" else "wirelength"
+        best = min(results, key=lambda x: x[key])
+        print("Best placement:", best["placement"], key + ":", best[key])
+        copies = [(best["route"], route_file),
+                  (best["placement"],
+                   os.path.splitext(route_file)[0] + ".place")]
+        if args.binary:
+            copies.append((get_binary_routing_filename(best["route"]),
+                           get_binary_routing_filename(route_file)))
+        for src, dst in copies:
+            if os.path.abspath(src) != os.path.abspath(dst):
+                shutil.copyfile(src, dst)
+        return
+    checkpoint_file = os.path.splitext(route_file)[0] + ".checkpoint"
+    if args.resume:
+        if os.path.isfile(checkpoint_file):
+            r.load_checkpoint(checkpoint_file)
+        else:
+            print("No checkpoint found at", checkpoint_file)
+    if args.checkpoint or args.resume:
+        r.enable_checkpoint(checkpoint_file)
+        # turn termination, e.g. preemption, into an exception so that the
+        # progress is saved
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    if args.prev_route_file is not None:
+        prev_route_result = load_routing_result(args.prev_route_file)
+        prev_placement, _ = parse_placement(args.prev_placement_filename)
+        r.route_incremental(prev_route_result, prev_placement,
+                            jobs=args.jobs, partition=args.partition)
+    elif args.negotiate:
+        r.route_negotiated()
+    else:
+        r.route(jobs=args.jobs, partition=args.partition)
+    if args.netlist_json is not None:
+        print("Estimated critical path delay:", r.update_criticality())
     if vis_opt:
         r.vis_routing_resource()
     # r.compute_stats()
 
-    save_routing_result(r.route_result, route_file)
+    route_result = r.get_route_result()
+    save_routing_result(route_result, route_file)
+    if args.binary:
+        save_binary_routing_result(route_result,
+                                   get_binary_routing_filename(route_file))
+    if args.stats:
+        r.save_stats(route_file)
+    if (args.checkpoint or args.resume) and os.path.isfile(checkpoint_file):
+        # the routing is done
+        os.remove(checkpoint_file)
 
 
 if __name__ == "__main__":
@@ -33,6 +33,8 @@ echo "CMakeList.txt backup: ${temp_cmake}"
 sed -i -e 's/-march=native//g' ${thunder_cmake}
 pip install thunder/ -t ${DST_DIR}
 cp ${temp_cmake} ${thunder_cmake}
+# place.py needs six
+pip install six -t ${DST_DIR}
 
 # then copy files that will be used for detailed placement
 cp -r ${ROOTDIR}/arch ${DST_DIR}/
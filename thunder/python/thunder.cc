@@ -15,6 +15,11 @@ using std::string;
 using std::pair;
 using std::set;
 
+// long running calls release the GIL so that Python threads can run
+// several placers at once. arguments are converted before it is released
+// and the results after it is acquired again
+using release_gil = py::call_guard<py::gil_scoped_release>;
+
 
 void init_pythunder(py::module &m) {
     py::class_<DetailedMove>(m, "DetailedMove")
@@ -33,10 +38,10 @@ void init_pythunder(py::module &m) {
                     ::map<::string, ::pair<int, int>>,
                     char,
                     bool>())
-            .def("anneal", &SimAnneal::anneal)
+            .def("anneal", &SimAnneal::anneal, release_gil())
             .def("realize", &DetailedPlacer::realize)
-            .def("refine", &SimAnneal::refine)
-            .def("estimate", &DetailedPlacer::estimate)
+            .def("refine", &SimAnneal::refine, release_gil())
+            .def("estimate", &DetailedPlacer::estimate, release_gil())
             .def_readwrite("steps", &DetailedPlacer::steps)
             .def_readwrite("tmax", &DetailedPlacer::tmax)
             .def_readwrite("tmin", &DetailedPlacer::tmin);
@@ -48,7 +53,7 @@ void init_pythunder(py::module &m) {
                     std::map<std::string, std::pair<int, int>>,
                     char,
                     bool>())
-            .def("anneal", &VPRPlacer::anneal)
+            .def("anneal", &VPRPlacer::anneal, release_gil())
             .def("realize", &VPRPlacer::realize);
 
     py::class_<GlobalPlacer>(m, "GlobalPlacer")
@@ -58,16 +63,16 @@ void init_pythunder(py::module &m) {
                     std::vector<std::vector<char>>,
                     char,
                     bool>())
-            .def("solve", &GlobalPlacer::solve)
+            .def("solve", &GlobalPlacer::solve, release_gil())
             .def("realize", &GlobalPlacer::realize)
-            .def("anneal", &SimAnneal::anneal)
+            .def("anneal", &SimAnneal::anneal, release_gil())
             .def_readwrite("anneal_param_factor",
                            &GlobalPlacer::anneal_param_factor)
             .def_readwrite("steps", &GlobalPlacer::steps);
 }
 
 void init_detailed_placement(py::module &m) {
-    m.def("detailed_placement", &multi_place);
+    m.def("detailed_placement", &multi_place, release_gil());
 }
 
 PYBIND11_MODULE(pythunder, m) {
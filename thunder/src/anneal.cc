@@ -65,8 +65,8 @@ double SimAnneal::estimate(const uint32_t steps) {
     }
 
     auto end = std::chrono::system_clock::now();
-    auto elapsed =
-            std::chrono::duration_cast<std::chrono::milliseconds>(end - start);
+    // fractional milliseconds so that small clusters don't round to 0
+    std::chrono::duration<double, std::milli> elapsed = end - start;
     double time = elapsed.count();
     // this is in ms
     double total_time = time * this->steps / steps;
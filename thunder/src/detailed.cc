@@ -512,6 +512,20 @@ void DetailedPlacer::move() {
                               std::to_string(this->current_step));
     }
 
+    // check the cached bbox
+    for (uint64_t i = 0; i < netlist_.size(); i++) {
+        const auto bbox = compute_bbox(netlist_[i], instances_);
+        const auto &cached = net_bboxes_[i];
+        if (bbox.xmin != cached.xmin || bbox.xmax != cached.xmax ||
+            bbox.ymin != cached.ymin || bbox.ymax != cached.ymax ||
+            bbox.num_xmin != cached.num_xmin ||
+            bbox.num_xmax != cached.num_xmax ||
+            bbox.num_ymin != cached.num_ymin ||
+            bbox.num_ymax != cached.num_ymax)
+            throw ::runtime_error("bbox checking failed for net " +
+                                  netlist_[i].net_id);
+    }
+
     // check loc instance
     for (const auto &id : instance_ids_) {
         const auto &instance = instances_[id];
@@ -526,16 +540,16 @@ void DetailedPlacer::move() {
     auto curr_ins_id =
             instance_ids_[detail_rand_.uniform<uint64_t>
                           (0, instance_ids_.size() - 1)];
-    auto curr_ins = instances_[curr_ins_id];
+    const auto &curr_ins = instances_[curr_ins_id];
     // only swap with the same type
     char blk_type = curr_ins.name[0];
     // search for x, y that is within the d_limit
     const auto curr_pos = curr_ins.pos;
-    Instance next_ins;
+    const Instance *next_ins;
     if (d_limit_ >= max_dim_) {
         auto[start_index, end_index] = instance_type_index_[blk_type];
-        next_ins = instances_[detail_rand_.uniform<uint64_t>(start_index,
-                                                                  end_index)];
+        next_ins = &instances_[detail_rand_.uniform<uint64_t>(start_index,
+                                                                   end_index)];
     } else {
         int r = (int)(d_limit_ / 2);
         r = r > 0 ? r : 1;
@@ -551,26 +565,26 @@ void DetailedPlacer::move() {
             return;
 
         const int id = loc_instances_[blk_type][pos];
-        next_ins = instances_[id];
+        next_ins = &instances_[id];
     }
 
-    if (curr_ins.name[0] != next_ins.name[0])
+    if (curr_ins.name[0] != next_ins->name[0])
         throw ::runtime_error("unexpected move selection error");
 
-    if (curr_ins.name == next_ins.name)
+    if (curr_ins.name == next_ins->name)
         return;
 
     // check if it's legal in reg net
     if (fold_reg_) {
-        if ((!is_reg_net(curr_ins, next_ins.pos))
-        || (!is_reg_net(next_ins, curr_ins.pos)))
+        if ((!is_reg_net(curr_ins, next_ins->pos))
+        || (!is_reg_net(*next_ins, curr_ins.pos)))
             return;
     }
 
     // swap
     this->moves_.insert(DetailedMove{.blk_id = curr_ins.id,
-                                     .new_pos = next_ins.pos});
-    this->moves_.insert(DetailedMove{.blk_id = next_ins.id,
+                                     .new_pos = next_ins->pos});
+    this->moves_.insert(DetailedMove{.blk_id = next_ins->id,
                                      .new_pos = curr_ins.pos});
 }
 
@@ -692,41 +706,48 @@ uint32_t DetailedPlacer::estimate_num_swaps() const {
 
 
 double DetailedPlacer::energy() {
-    if (!this->moves_.empty()) {
-        map<int, Point> original;
-        set<int> changed_net;
-        for (auto const &move : this->moves_) {
-            original[move.blk_id] = Point(instances_[move.blk_id].pos);
-            for (const int net: instances_[move.blk_id].nets) {
-                changed_net.insert(net);
-            }
-        }
-        // convert to net
-        vector<Net> nets(changed_net.size());
-        int count = 0;
-        for (auto const net_id : changed_net) {
-            nets[count++] = netlist_[net_id];
-        }
-        double old_hpwl = get_hpwl(nets, this->instances_);
-
-        // change the locations
-        for (const auto &move : moves_) {
-            int blk_id = move.blk_id;
-            instances_[blk_id].pos = Point(move.new_pos);
-        }
+    changed_nets_.clear();
+    if (this->moves_.empty())
+        return this->curr_energy;
 
-        // compute the new hpwl
-        double new_hpwl = get_hpwl(nets, this->instances_);
+    bbox_stamp_ += 2;
+    // change the locations so that the bbox can be recomputed if needed
+    vector<pair<int, Point>> original;
+    original.reserve(moves_.size());
+    for (const auto &move : moves_) {
+        int blk_id = move.blk_id;
+        original.emplace_back(blk_id, instances_[blk_id].pos);
+        instances_[blk_id].pos = Point(move.new_pos);
+    }
 
-        // revert
-        for (const auto &iter : original)
-            instances_[iter.first].pos = iter.second;
+    // update the bbox of every net connected to the moved pins
+    int delta = 0;
+    for (const auto &iter : original) {
+        const auto &ins = instances_[iter.first];
+        for (const int net_id : ins.nets) {
+            if (net_stamp_[net_id] == bbox_stamp_ + 1)
+                continue;
+            if (net_stamp_[net_id] != bbox_stamp_) {
+                net_stamp_[net_id] = bbox_stamp_;
+                new_bboxes_[net_id] = net_bboxes_[net_id];
+                changed_nets_.emplace_back(net_id);
+            }
+            auto &bbox = new_bboxes_[net_id];
+            if (!update_bbox(bbox, iter.second, ins.pos)) {
+                // all the pins are in their new locations already
+                bbox = compute_bbox(netlist_[net_id], instances_);
+                net_stamp_[net_id] = bbox_stamp_ + 1;
+            }
+        }
+    }
+    for (const int net_id : changed_nets_)
+        delta += new_bboxes_[net_id].hpwl() - net_bboxes_[net_id].hpwl();
 
-        return this->curr_energy + (new_hpwl - old_hpwl);
+    // revert
+    for (const auto &iter : original)
+        instances_[iter.first].pos = iter.second;
 
-    } else {
-        return this->curr_energy;
-    }
+    return this->curr_energy + delta;
 }
 
 void DetailedPlacer::commit_changes() {
@@ -738,10 +759,23 @@ void DetailedPlacer::commit_changes() {
         int blk_id = move.blk_id;
         instances_[blk_id].pos = Point(move.new_pos);
     }
+    for (const int net_id : changed_nets_)
+        net_bboxes_[net_id] = new_bboxes_[net_id];
+    changed_nets_.clear();
 }
 
 double DetailedPlacer::init_energy() {
-    return get_hpwl(this->netlist_, this->instances_);
+    net_bboxes_.resize(netlist_.size());
+    new_bboxes_.resize(netlist_.size());
+    net_stamp_.assign(netlist_.size(), 0);
+    bbox_stamp_ = 0;
+    changed_nets_.clear();
+    double hpwl = 0;
+    for (uint64_t i = 0; i < netlist_.size(); i++) {
+        net_bboxes_[i] = compute_bbox(netlist_[i], instances_);
+        hpwl += net_bboxes_[i].hpwl();
+    }
+    return hpwl;
 }
 
 ::map<std::string, std::pair<int, int>> DetailedPlacer::realize() {
@@ -58,6 +58,17 @@ protected:
     uint32_t num_blocks_ = 0;
     uint32_t num_swap_ = 0;
 
+    // cached bounding box of each net, updated incrementally on every move
+    std::vector<BBox> net_bboxes_;
+    // bounding boxes of the nets changed by the current moves, which will be
+    // written back in commit_changes()
+    std::vector<BBox> new_bboxes_;
+    std::vector<int> changed_nets_;
+    // net_stamp_ is bbox_stamp_ if the net has been changed by the current
+    // moves and bbox_stamp_ + 1 if its bbox has been recomputed
+    std::vector<uint64_t> net_stamp_;
+    uint64_t bbox_stamp_ = 0;
+
 private:
     void init_place_regular(const std::vector<std::string> &cluster_blocks,
                             std::map<std::string, int> &blk_id_dict,
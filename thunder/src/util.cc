@@ -45,6 +45,81 @@ double get_hpwl(const ::vector<Net> &netlist,
     return hpwl;
 }
 
+BBox compute_bbox(const Net &net, const ::vector<Instance> &instances) {
+    BBox bbox;
+    bbox.xmin = INT_MAX;
+    bbox.xmax = INT_MIN;
+    bbox.ymin = INT_MAX;
+    bbox.ymax = INT_MIN;
+    for (const int blk_id : net.instances) {
+        const auto &pos = instances[blk_id].pos;
+        if (pos.x < bbox.xmin) {
+            bbox.xmin = pos.x;
+            bbox.num_xmin = 1;
+        } else if (pos.x == bbox.xmin) {
+            bbox.num_xmin++;
+        }
+        if (pos.x > bbox.xmax) {
+            bbox.xmax = pos.x;
+            bbox.num_xmax = 1;
+        } else if (pos.x == bbox.xmax) {
+            bbox.num_xmax++;
+        }
+        if (pos.y < bbox.ymin) {
+            bbox.ymin = pos.y;
+            bbox.num_ymin = 1;
+        } else if (pos.y == bbox.ymin) {
+            bbox.num_ymin++;
+        }
+        if (pos.y > bbox.ymax) {
+            bbox.ymax = pos.y;
+            bbox.num_ymax = 1;
+        } else if (pos.y == bbox.ymax) {
+            bbox.num_ymax++;
+        }
+    }
+    return bbox;
+}
+
+static bool update_edge(int old_v, int new_v, int &v_min, int &v_max,
+                        int &num_min, int &num_max) {
+    if (new_v < old_v) {
+        // leaving the max edge
+        if (old_v == v_max) {
+            if (num_max == 1)
+                return false;
+            num_max--;
+        }
+        if (new_v < v_min) {
+            v_min = new_v;
+            num_min = 1;
+        } else if (new_v == v_min) {
+            num_min++;
+        }
+    } else if (new_v > old_v) {
+        // leaving the min edge
+        if (old_v == v_min) {
+            if (num_min == 1)
+                return false;
+            num_min--;
+        }
+        if (new_v > v_max) {
+            v_max = new_v;
+            num_max = 1;
+        } else if (new_v == v_max) {
+            num_max++;
+        }
+    }
+    return true;
+}
+
+bool update_bbox(BBox &bbox, const Point &old_pos, const Point &new_pos) {
+    return update_edge(old_pos.x, new_pos.x, bbox.xmin, bbox.xmax,
+                       bbox.num_xmin, bbox.num_xmax) &&
+           update_edge(old_pos.y, new_pos.y, bbox.ymin, bbox.ymax,
+                       bbox.num_ymin, bbox.num_ymax);
+}
+
 ::vector<::string> squash_net(::map<::string, ::vector<::string>> &nets,
                      const ::string &src_id,
                      ::map<::string, ::string> reg_srcs) {
@@ -51,9 +51,31 @@ struct Net {
     std::vector<int> instances;
 };
 
+// net bounding box with the number of pins sitting on each edge, which
+// allows incremental updates when pins move
+struct BBox {
+    int xmin = 0;
+    int xmax = 0;
+    int ymin = 0;
+    int ymax = 0;
+    int num_xmin = 0;
+    int num_xmax = 0;
+    int num_ymin = 0;
+    int num_ymax = 0;
+
+    int hpwl() const { return (xmax - xmin) + (ymax - ymin); }
+};
+
 double get_hpwl(const std::vector<Net> &netlist,
                 const std::vector<Instance> &instances);
 
+BBox compute_bbox(const Net &net, const std::vector<Instance> &instances);
+
+// update the bbox when one pin moves from old_pos to new_pos. returns false
+// if the pin was the only one on a shrinking edge, in which case the bbox
+// has to be recomputed
+bool update_bbox(BBox &bbox, const Point &old_pos, const Point &new_pos);
+
 std::map<std::string, std::vector<std::string>> group_reg_nets(
         std::map<std::string, std::vector<std::string>> &netlist);
 
@@ -2,6 +2,30 @@ from __future__ import division
 import json
 
 
+def get_unique_blocks(net):
+    """blocks of the net without duplicates, in their original order"""
+    blocks = []
+    seen = set()
+    for blk_id in net:
+        if blk_id not in seen:
+            seen.add(blk_id)
+            blocks.append(blk_id)
+    return blocks
+
+
+def get_cluster_nodes(clusters, fixed_blocks):
+    """the node each block becomes in a reduced netlist. fixed blocks stay as
+       they are and clustered blocks become their cluster, "x" + cluster id"""
+    nodes = {}
+    for cid in clusters:
+        for blk_id in clusters[cid]:
+            if blk_id not in nodes:
+                nodes[blk_id] = "x" + str(cid)
+    for blk_id in fixed_blocks:
+        nodes[blk_id] = blk_id
+    return nodes
+
+
 def reduce_cluster_graph(netlists, clusters, fixed_blocks,
                          cluster_id=None):
     """NOTE: cluster_blocks holds block IDs, not cell locations"""
@@ -11,44 +35,96 @@ def reduce_cluster_graph(netlists, clusters, fixed_blocks,
     else:
         condense_self = False
     current_cluster = clusters[cluster_id]
+    nodes = get_cluster_nodes(clusters, fixed_blocks)
     new_netlist = {}
     for net_id in netlists:
-        netlist = []
-        for blk_id in netlists[net_id]:
-            if blk_id not in netlist:
-                netlist.append(blk_id)
-        netlist_set = set(netlist)
-        if len(netlist_set.intersection(current_cluster)) > 0:
-            # we need to reduce the net
-            new_net = []
-            for blk_id in netlist:
-                if blk_id in current_cluster:
-                    if condense_self:
-                        new_node = "x" + str(cluster_id)
-                        new_net.append(new_node)
-                    else:
-                        new_net.append(blk_id)
-                elif blk_id in fixed_blocks:
-                    new_net.append(blk_id)
+        netlist = get_unique_blocks(netlists[net_id])
+        if not any([blk_id in current_cluster for blk_id in netlist]):
+            continue
+        # we need to reduce the net
+        new_net = []
+        for blk_id in netlist:
+            if blk_id in current_cluster:
+                if condense_self:
+                    new_net.append("x" + str(cluster_id))
                 else:
-                    # search for all the other netlists
-                    # we use "x" for clusters
-                    found = False
-                    for cid in clusters:
-                        if cid == cluster_id:
-                            continue
-                        if blk_id in clusters[cid]:
-                            new_node = "x" + str(cid)
-                            new_net.append(new_node)
-                            found = True
-                            break
-                    if not found:
-                        raise Exception("not found blk", blk_id)
-
-            new_netlist[net_id] = new_net
+                    new_net.append(blk_id)
+            elif blk_id in nodes:
+                new_net.append(nodes[blk_id])
+            else:
+                raise Exception("not found blk", blk_id)
+        new_netlist[net_id] = new_net
     return new_netlist
 
 
+def reduce_cluster_graphs(netlists, clusters, fixed_blocks):
+    """reduced netlists of every cluster, indexed by cluster id. the same as
+       calling reduce_cluster_graph() with each cluster id, but done in a
+       single pass over the netlists"""
+    nodes = get_cluster_nodes(clusters, fixed_blocks)
+    blk_clusters = {}
+    result = {}
+    for cid in clusters:
+        result[cid] = {}
+        for blk_id in clusters[cid]:
+            if blk_id not in blk_clusters:
+                blk_clusters[blk_id] = []
+            blk_clusters[blk_id].append(cid)
+    for net_id in netlists:
+        netlist = get_unique_blocks(netlists[net_id])
+        # clusters the net goes through
+        net_clusters = []
+        for blk_id in netlist:
+            if blk_id in blk_clusters:
+                net_clusters += blk_clusters[blk_id]
+        if len(net_clusters) == 0:
+            continue
+        net_nodes = []
+        for blk_id in netlist:
+            if blk_id not in nodes:
+                raise Exception("not found blk", blk_id)
+            net_nodes.append(nodes[blk_id])
+        for cid in set(net_clusters):
+            current_cluster = clusters[cid]
+            result[cid][net_id] = [blk_id if blk_id in current_cluster
+                                   else node for blk_id, node
+                                   in zip(netlist, net_nodes)]
+    return result
+
+
+def compute_hpwl(netlists, placement):
+    """total half-perimeter wire length of the placement"""
+    total = 0
+    for net_id in netlists:
+        xs = [placement[blk_id][0] for blk_id in netlists[net_id]]
+        ys = [placement[blk_id][1] for blk_id in netlists[net_id]]
+        total += max(xs) - min(xs) + max(ys) - min(ys)
+    return total
+
+
+def compute_mst_length(netlists, placement):
+    """total length of the rectilinear minimum spanning tree of every net,
+       which is a quick estimate of the routed wire length"""
+    total = 0
+    for net_id in netlists:
+        points = list(set([tuple(placement[blk_id])
+                           for blk_id in netlists[net_id]]))
+        # Prim's algorithm on the complete graph of the pins
+        x0, y0 = points[0]
+        dists = [abs(x - x0) + abs(y - y0) for x, y in points[1:]]
+        points = points[1:]
+        while len(points) > 0:
+            index = dists.index(min(dists))
+            total += dists[index]
+            x0, y0 = points[index]
+            points.pop(index)
+            dists.pop(index)
+            for i in range(len(points)):
+                x, y = points[i]
+                dists[i] = min(dists[i], abs(x - x0) + abs(y - y0))
+    return total
+
+
 def compute_centroid(cluster_cells):
     if type(cluster_cells) == list or type(cluster_cells) == set:
         x_sum = 0
@@ -111,7 +187,7 @@ def deepcopy(obj_to_copy):
 def get_sls_config(config_file):
     import yaml
     with open(config_file) as f:
-        data = yaml.load(f)
+        data = yaml.safe_load(f)
     functions = data["functions"]
     result = {}
     for func_name in functions:
@@ -142,6 +218,9 @@ def choose_resource(estimated_time, config_file):
     sizes.sort()
     max_mem = sizes[-1]
     max_time = estimated_time[max_index]
+    if max_time <= 0:
+        # nothing to tell them apart
+        max_time = 1
 
     result = {max_index: (max_mem, mem_sizes[max_mem])}
     index_list.remove(max_index)
@@ -105,6 +105,7 @@ def visualize_clustering_cgra(board_meta, cluster_cells):
 def visualize_routing(cgra_filename, board_meta, packed_filename,
                       routing_result, fold_reg):
     from router import Router
+    from arch.cgra_route import encode_wire
     router = Router(cgra_filename, board_meta, packed_filename,
                     "", fold_reg=fold_reg)
     # update routing resource
@@ -142,21 +143,20 @@ def visualize_routing(cgra_filename, board_meta, packed_filename,
                         entry_to_remove.add((dst_pos, conn))
                         track_in = conn
         for pos, conn in entry_to_remove:
-            resource = router.routing_resource[pos]["route_resource"]
-            remove_set = set()
-            for conn1, conn2 in resource:
-                if conn1 == conn or conn2 == conn:
-                    remove_set.add((conn1, conn2))
-            for entry in remove_set:
-                resource.remove(entry)
+            conn = encode_wire(*conn)
+            routing_resource = router.routing_resource
+            routing_resource.remove_conn_in(pos, conn)
+            routing_resource.remove_conn_out(pos, conn)
+    # the wire map is updated on commit
+    router.routing_resource.commit()
 
     router.vis_routing_resource()
 
 
 def visualize_board(cgra_file):
-    from arch import parse_cgra
+    from arch import load_cgra
     color_index = "imopr"
-    board_meta = parse_cgra(cgra_file)["CGRA"]
+    board_meta = load_cgra(cgra_file)["CGRA"]
     board_layout = board_meta[0]
     scale = 30
     board_info = board_meta[-1]
@@ -190,7 +190,8 @@ def main():
         return
     if len(sys.argv) != 4:
         print("[Usage]:", sys.argv[0], "<cgra_info>",
-              "[<design.packed>", "<design.place|design.route>]",
+              "[<design.packed>",
+              "<design.place|design.route|design.broute>]",
               file=sys.stderr)
         exit(1)
     cgra_info = sys.argv[1]
@@ -198,16 +199,16 @@ def main():
     input_file = sys.argv[3]
     basename = os.path.basename(input_file)
     design_name, ext = os.path.splitext(basename)
-    from arch import parse_cgra
+    from arch import load_cgra
     from arch import load_packed_file
     _, _, _, changed_pe = load_packed_file(packed_file)
     fold_reg = len(changed_pe) == 0
-    board_meta = parse_cgra(cgra_info, fold_reg=fold_reg)["CGRA"]
+    board_meta = load_cgra(cgra_info, fold_reg=fold_reg)["CGRA"]
     if ext == ".place":
         from arch import parse_placement
         board_pos, _ = parse_placement(input_file)
         visualize_placement_cgra(board_meta, board_pos, design_name, changed_pe)
-    elif ext == ".route":
+    elif ext == ".route" or ext == ".broute":
         from arch import parse_routing_result
         routing_result = parse_routing_result(input_file)
         visualize_routing(cgra_info, board_meta, packed_file, routing_result,